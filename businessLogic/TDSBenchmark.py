@@ -0,0 +1,722 @@
+import os
+import sys
+import time
+import json
+import zlib
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pandas as pd
+from TDSCoinbaseData import TDSCoinbaseData
+from TDSTickGenerator import TDSTick, TDSTickGenerator
+from TDSTransactionTracker import TDSTransactionTracker
+from TDSPerformanceMetrics import TDSPerformanceMetrics
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+####################################################################################
+class TDSBaselineTracker:
+####################################################################################
+
+
+    ################################################################################
+    def __init__(self, holdings, max_taken_vol=0.5, fee_rate=0.0018):
+        """
+
+        The original dict based make_trade, kept unchanged as the before of the make_trade benchmark -- not for trading
+
+        Parameters:
+        holdings       (dict)   : initial holdings dict
+        max_taken_vol  (float)  : Max pct of volume that can be taken in a given tick
+        fee_rate       (float)  : Fee rate per transaction
+
+        """
+        self.trades = []
+        self.holdings = holdings
+        self.max_taken_vol = max_taken_vol
+        self.fee_rate = fee_rate
+
+
+    ################################################################################
+    def make_trade(self, tick, product, side, size):
+        """
+
+        Attempt to make a trade. Error if attempted trade is invalid, otherwise return the trade record
+
+        Parameters:
+        tick    (TDSTick)  : current tick
+        product (str)      : '<BASE>-<QUOTE>'
+        side    (str)      : 'buy' or 'sell'
+        size    (float)    : Amount of HELD currency to trade
+
+        Returns:
+        dict: record of the single trade
+
+        """
+        side = side.lower()
+        liq_instr = None
+        aq_instr = None
+
+        base = product.split('-')[0]
+        quote = product.split('-')[1]
+
+        if side.lower() == 'sell':
+            liq_instr = base
+            aq_instr = quote
+        elif side.lower() == 'buy':
+            liq_instr = quote
+            aq_instr = base
+        else:
+            # check if side is invalid
+            raise Exception(f'INVALID SIDE : {side}')
+
+        size_to_liq = size
+        if liq_instr not in self.holdings:
+            # ensure holding enough funds to execute
+            raise Exception(f'INSIFFICIENT FUNDS : Not holding any {liq_instr}')
+
+        if size < 0:
+            # liquidate entire position
+            size_to_liq = self.holdings[liq_instr]
+
+        if size_to_liq > self.holdings[liq_instr]:
+            # ensure holding enough funds to execute
+            raise Exception(f'INSUFFICIENT FUNDS : attempted to liquidate {size_to_liq} {liq_instr} only holding {self.holdings[liq_instr]} {liq_instr}')
+
+        product_info = getattr(tick.p, product.lower().replace('-', '_'))
+
+        available_volume = product_info.volume * self.max_taken_vol
+
+        volume_moving = size_to_liq
+        if side.lower() == 'buy':
+            volume_moving = size_to_liq / product_info.close
+
+        if available_volume < volume_moving:
+            # ensure enough market volume to execute trade
+            raise Exception(f'INSUFFICIENT MARKET VOLUME : attempting to move {volume_moving} {base} only {available_volume} {base} available')
+
+        self.holdings[liq_instr] -= size_to_liq
+
+        size_to_liq -= self.fee_rate * size_to_liq
+
+        conv_volume = None
+        exec_price = None
+
+        # execute at the close price
+        if side.lower() == 'buy':
+            exec_price = product_info.close
+            conv_volume = size_to_liq / exec_price
+        elif side.lower() == 'sell':
+            exec_price = product_info.close
+            conv_volume = size_to_liq * exec_price
+
+        # adjust holdings
+        if aq_instr not in self.holdings:
+            self.holdings[aq_instr] = 0
+
+        self.holdings[aq_instr] += conv_volume
+
+        # create the trade record
+        trade = {
+            'date'      : tick.date,
+            'timestamp' : tick.timestamp,
+            'side'      : side,
+            'size'      : volume_moving,
+            'price'     : exec_price,
+            'product'   : product,
+            'holdings'  : self.holdings.copy(),
+        }
+
+        self.trades.append(trade)
+        return trade
+
+
+####################################################################################
+class TDSBenchmark:
+####################################################################################
+
+
+    BENCHMARKS = ['tick_generator', 'make_trade', 'market_data', 'metrics']
+
+
+    ################################################################################
+    def __init__(self, seed=0, cache_path=None, trace_memory=False):
+        """
+
+        Benchmarks of the core hot paths on synthetic data -- no network or cached data needed. Market data is
+        written to a synthetic cache in the same layout as TDSCoinbaseData's, so the real loading paths are timed
+
+        Parameters:
+        seed          (int)   : random seed for the synthetic data
+        cache_path    (str)   : directory for the synthetic cache, a temporary one removed by close if None
+        trace_memory  (bool)  : record each benchmark's peak python heap with tracemalloc -- slows the timed code down,
+                                so compare timings only between runs with the same setting
+
+        """
+        self.seed = seed
+        self.trace_memory = trace_memory
+        self.is_temp_cache = cache_path is None
+        self.cache_path = tempfile.mkdtemp(prefix='tds_benchmark_') if cache_path is None else cache_path
+        self.cb_data_obj = TDSCoinbaseData(self.cache_path)
+        self.cached_days = set()
+        self.results = {}
+
+
+    ################################################################################
+    def close(self):
+        """
+
+        Remove the synthetic cache if it is a temporary one
+
+        Returns:
+        None
+
+        """
+        if self.is_temp_cache and os.path.isdir(self.cache_path):
+            shutil.rmtree(self.cache_path)
+
+
+    ################################################################################
+    @staticmethod
+    def get_dates(start_date, num_days):
+        """
+
+        Get consecutive dates
+
+        Parameters:
+        start_date  (str)  : YYYYMMDD first date
+        num_days    (int)  : number of dates
+
+        Returns:
+        list : YYYYMMDD dates
+
+        """
+        start_dt = datetime.strptime(start_date, '%Y%m%d')
+        return [(start_dt + timedelta(days=i)).strftime('%Y%m%d') for i in range(num_days)]
+
+
+    ################################################################################
+    def make_day(self, product, date, close, interval=60, gap_fraction=0.0):
+        """
+
+        Build a day of synthetic market data in the cached format
+
+        Parameters:
+        product       (str)      : product of data
+        date          (str)      : YYYYMMDD date of data
+        close         (ndarray)  : close price of every interval of the day
+        interval      (int)      : interval of data
+        gap_fraction  (float)    : fraction of rows to drop at random, as missing rows are dropped by the api
+
+        Returns:
+        DataFrame : df of market data
+
+        """
+        rng = np.random.RandomState((self.seed, int(date), zlib.crc32(product.encode())))
+        start = int(datetime.strptime(date, '%Y%m%d').replace(tzinfo=timezone.utc).timestamp())
+        timestamps = start + interval * np.arange(len(close))
+        open_ = np.concatenate([close[:1], close[:-1]])
+
+        df = pd.DataFrame({
+            'timestamp' : timestamps.astype(np.int64),
+            'low'       : np.minimum(open_, close) * (1 - rng.uniform(0, 1e-3, len(close))),
+            'high'      : np.maximum(open_, close) * (1 + rng.uniform(0, 1e-3, len(close))),
+            'open'      : open_,
+            'close'     : close,
+            'volume'    : rng.lognormal(2, 1, len(close)),
+        })
+        df['datetime'] = pd.to_datetime(df['timestamp'], unit='s', utc=True)
+        df['product'] = product
+        df['date'] = date
+
+        if gap_fraction > 0:
+            df = df[rng.uniform(size=len(df)) >= gap_fraction].reset_index(drop=True)
+        return df
+
+
+    ################################################################################
+    def make_cache(self, products, start_date, num_days, gap_fraction=0.0):
+        """
+
+        Write random walk market data to the synthetic cache, minute bars and the daily bars used to value holdings
+
+        Parameters:
+        products      (list)   : products of data
+        start_date    (str)    : YYYYMMDD first date
+        num_days      (int)    : number of dates
+        gap_fraction  (float)  : fraction of minute rows to drop
+
+        Returns:
+        list : YYYYMMDD dates written
+
+        """
+        dates = self.get_dates(start_date, num_days)
+        for product in products:
+            if all((product, date) in self.cached_days for date in dates):
+                continue
+            # crc32 rather than anything order free, ex. BTC-USD and BTC-EUR must not share a walk
+            rng = np.random.RandomState((self.seed, zlib.crc32(product.encode())))
+
+            # one walk across every date so each day opens at the previous day's close
+            close = 100 * np.exp(np.cumsum(rng.normal(0, 1e-3, num_days * 1440)))
+            for i, date in enumerate(dates):
+                day = close[i * 1440:(i + 1) * 1440]
+                minutes = self.make_day(product, date, day, 60, gap_fraction)
+                self.cb_data_obj.save_data(minutes, product, date, 60)
+
+                daily = minutes.iloc[[-1]].copy()
+                daily['timestamp'] = minutes['timestamp'].values[0]
+                daily['datetime'] = minutes['datetime'].values[0]
+                daily['open'] = minutes['open'].values[0]
+                daily['high'] = minutes['high'].max()
+                daily['low'] = minutes['low'].min()
+                daily['volume'] = minutes['volume'].sum()
+                self.cb_data_obj.save_data(daily.reset_index(drop=True), product, date, 86400)
+                self.cached_days.add((product, date))
+        return dates
+
+
+    ################################################################################
+    @staticmethod
+    def time_calls(func, repeats):
+        """
+
+        Time repeated calls of a function
+
+        Parameters:
+        func     (function)  : function of no arguments
+        repeats  (int)       : number of calls
+
+        Returns:
+        dict : best and mean seconds per call
+
+        """
+        times = []
+        for i in range(repeats):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+        return {'best' : min(times), 'mean' : sum(times) / len(times)}
+
+
+    ################################################################################
+    def make_ticks(self, products, num_ticks, start_timestamp=1593561600, interval=60):
+        """
+
+        Build synthetic ticks with random walk prices and ample volume
+
+        Parameters:
+        products         (list)  : products to include in each tick
+        num_ticks        (int)   : number of ticks
+        start_timestamp  (int)   : timestamp of the first tick
+        interval         (int)   : tick size
+
+        Returns:
+        list : list of TDSTick
+
+        """
+        rng = np.random.RandomState(self.seed)
+        names = [product.replace('-', '_').lower() for product in products]
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 1e-3, (num_ticks, len(products))), axis=0))
+
+        ticks = []
+        for i in range(num_ticks):
+            row = np.empty((len(products), 5))
+            row[:, 0] = close[i - 1] if i > 0 else close[i]
+            row[:, 1] = close[i] * 1.001
+            row[:, 2] = close[i] * 0.999
+            row[:, 3] = close[i]
+            row[:, 4] = 1e6
+            timestamp = start_timestamp + i * interval
+            date = time.strftime('%Y%m%d', time.gmtime(timestamp))
+            ticks.append(TDSTick(date, timestamp, None, interval, names, row))
+        return ticks
+
+
+    ################################################################################
+    def benchmark_make_trade(self, num_trades=100000, repeats=5):
+        """
+
+        Trades/sec of the original make_trade, make_trade and make_trade_fast on the same round trips, checking all
+        three end in identical holdings. The original caps each trade on its own, so the trackers run without
+        cumulative_volume to compare the same work
+
+        Parameters:
+        num_trades  (int)  : number of trades per run
+        repeats     (int)  : runs of each variant, the best is kept
+
+        Returns:
+        dict : trades/sec of each variant and the speedups over the original
+
+        """
+        ticks = self.make_ticks(['BTC-USD'], 1000)
+
+        # sell a little BTC, then buy back with all of the USD -- no fees so the round trips can repeat indefinitely
+        def run_baseline():
+            baseline = TDSBaselineTracker(holdings={'BTC' : 1.0}, fee_rate=0)
+            for i in range(num_trades):
+                tick = ticks[i % len(ticks)]
+                if i % 2 == 0:
+                    baseline.make_trade(tick, 'BTC-USD', 'sell', 0.01)
+                else:
+                    baseline.make_trade(tick, 'BTC-USD', 'buy', -1)
+            return baseline.holdings
+
+        def run_make_trade():
+            tracker = TDSTransactionTracker('20200701', '20200701', holdings={'BTC' : 1.0}, fee_rate=0, cumulative_volume=False)
+            for i in range(num_trades):
+                tick = ticks[i % len(ticks)]
+                if i % 2 == 0:
+                    tracker.make_trade(tick, 'BTC-USD', 'sell', 0.01)
+                else:
+                    tracker.make_trade(tick, 'BTC-USD', 'buy', -1)
+            return tracker.get_holdings()
+
+        def run_make_trade_fast():
+            tracker = TDSTransactionTracker('20200701', '20200701', holdings={'BTC' : 1.0}, fee_rate=0, cumulative_volume=False)
+            handle = tracker.register_product('BTC-USD')
+            sell, buy = tracker.SELL, tracker.BUY
+            for i in range(num_trades):
+                tick = ticks[i % len(ticks)]
+                if i % 2 == 0:
+                    tracker.make_trade_fast(tick, handle, sell, 0.01)
+                else:
+                    tracker.make_trade_fast(tick, handle, buy, -1)
+            return tracker.get_holdings()
+
+        # the variants take turns so that each sees the same machine load
+        variants = {'baseline_make_trade' : run_baseline, 'make_trade' : run_make_trade, 'make_trade_fast' : run_make_trade_fast}
+        times = {name : [] for name in variants}
+        holdings = {}
+        for i in range(repeats):
+            for name, run in variants.items():
+                start = time.perf_counter()
+                holdings[name] = run()
+                times[name].append(time.perf_counter() - start)
+
+        for name in ['make_trade', 'make_trade_fast']:
+            if holdings[name] != holdings['baseline_make_trade']:
+                raise Exception(f'HOLDINGS MISMATCH : {name} {holdings[name]} != {holdings["baseline_make_trade"]}')
+
+        best = {name : min(times[name]) for name in variants}
+        self.results['make_trade'] = {
+            'trades'                      : num_trades,
+            'repeats'                     : repeats,
+            'baseline_make_trade_per_sec' : num_trades / best['baseline_make_trade'],
+            'make_trade_per_sec'          : num_trades / best['make_trade'],
+            'make_trade_fast_per_sec'     : num_trades / best['make_trade_fast'],
+            'make_trade_speedup'          : best['baseline_make_trade'] / best['make_trade'],
+            'make_trade_fast_speedup'     : best['baseline_make_trade'] / best['make_trade_fast'],
+        }
+        return self.results['make_trade']
+
+
+    ################################################################################
+    def benchmark_tick_generator(self, num_days=7, products=('BTC-USD', 'ETH-USD', 'LTC-USD')):
+        """
+
+        Ticks/sec of get_tick and latency of setup_date, which loads and aligns each day's market data. The ticks/sec
+        include the setup_date of every day, as a backtest sees them
+
+        Parameters:
+        num_days  (int)   : number of days to generate ticks over
+        products  (list)  : products to include in each tick
+
+        Returns:
+        dict : ticks/sec with and without hourly bars, and setup_date seconds
+
+        """
+        products = list(products)
+        dates = self.make_cache(products, '20200701', num_days)
+        tick_gen = TDSTickGenerator(self.cb_data_obj, products, dates[0], dates[-1], 60)
+
+        setup_times = []
+        for date in dates:
+            start = time.perf_counter()
+            tick_gen.setup_date(date)
+            setup_times.append(time.perf_counter() - start)
+
+        results = {'days' : num_days, 'products' : len(products)}
+        for name, bar_intervals in [('ticks_per_sec', None), ('bar_ticks_per_sec', [3600])]:
+            tick_gen = TDSTickGenerator(self.cb_data_obj, products, dates[0], dates[-1], 60, bar_intervals=bar_intervals)
+            num_ticks = 0
+            start = time.perf_counter()
+            while tick_gen.get_tick() is not None:
+                num_ticks += 1
+            results[name] = num_ticks / (time.perf_counter() - start)
+
+        results['ticks'] = num_ticks
+        results['setup_date_best'] = min(setup_times)
+        results['setup_date_mean'] = sum(setup_times) / len(setup_times)
+        self.results['tick_generator'] = results
+        return results
+
+
+    ################################################################################
+    def benchmark_market_data(self, repeats=5, gap_fraction=0.2):
+        """
+
+        Seconds of get_single_day_market_data from the cache and of fill_gaps on a day missing rows, including
+        the missing first rows that are back filled from the previous day
+
+        Parameters:
+        repeats       (int)    : calls to time
+        gap_fraction  (float)  : fraction of the day's rows missing
+
+        Returns:
+        dict : best and mean seconds of each
+
+        """
+        dates = self.make_cache(['BTC-USD'], '20200701', 2)
+        cb_data_obj = self.cb_data_obj
+        day = cb_data_obj.get_single_day_market_data('BTC-USD', dates[1], 60)
+        rng = np.random.RandomState(self.seed)
+        keep = rng.uniform(size=len(day)) >= gap_fraction
+        keep[:10] = False
+        gappy = day[keep].reset_index(drop=True)
+
+        single_day = self.time_calls(lambda: cb_data_obj.get_single_day_market_data('BTC-USD', dates[1], 60), repeats)
+        fill_gaps = self.time_calls(lambda: cb_data_obj.fill_gaps(gappy, 'BTC-USD', dates[1], 60), repeats)
+
+        self.results['market_data'] = {
+            'missing_rows'                    : int(len(day) - len(gappy)),
+            'get_single_day_market_data_best' : single_day['best'],
+            'get_single_day_market_data_mean' : single_day['mean'],
+            'fill_gaps_best'                  : fill_gaps['best'],
+            'fill_gaps_mean'                  : fill_gaps['mean'],
+        }
+        return self.results['market_data']
+
+
+    ################################################################################
+    def benchmark_metrics(self, num_days=30, repeats=5):
+        """
+
+        Seconds of get_btc_holdings_over_time and get_sharpe_ratio on a tracker trading every tick of the period. The
+        first call also loads the daily closes, later calls find them cached
+
+        Parameters:
+        num_days  (int)  : number of days traded
+        repeats   (int)  : calls to time after the first
+
+        Returns:
+        dict : trades, first call seconds and best and mean seconds of later calls
+
+        """
+        products = ['BTC-USD', 'ETH-USD']
+        dates = self.make_cache(products, '20200701', num_days)
+        tracker = TDSTransactionTracker(dates[0], dates[-1], holdings={'BTC' : 1.0}, cb_data_obj=self.cb_data_obj)
+        btc_usd = tracker.register_product('BTC-USD')
+        eth_usd = tracker.register_product('ETH-USD')
+
+        # cycle BTC -> USD -> ETH -> USD -> BTC so every currency is held along the way, legs short of market volume are skipped
+        legs = [(btc_usd, tracker.SELL), (eth_usd, tracker.BUY), (eth_usd, tracker.SELL), (btc_usd, tracker.BUY)]
+        tick_gen = TDSTickGenerator(self.cb_data_obj, products, dates[0], dates[-1], 60)
+        tick = tick_gen.get_tick()
+        i = 0
+        while tick is not None:
+            handle, side = legs[i % len(legs)]
+            tracker.try_trade(tick, handle, side, -1 if side == tracker.BUY else 0.5 * tracker.holdings.get(handle.base, 0.0))
+            tick = tick_gen.get_tick()
+            i += 1
+
+        results = {'days' : num_days, 'trades' : len(tracker.trade_log)}
+        start = time.perf_counter()
+        tracker.get_btc_holdings_over_time()
+        results['get_btc_holdings_over_time_first'] = time.perf_counter() - start
+        timings = self.time_calls(tracker.get_btc_holdings_over_time, repeats)
+        results['get_btc_holdings_over_time_best'] = timings['best']
+        results['get_btc_holdings_over_time_mean'] = timings['mean']
+
+        # the metrics are memoized, so each call gets new ones
+        def get_sharpe_ratio():
+            tracker.metrics = TDSPerformanceMetrics(tracker)
+            tracker.get_sharpe_ratio()
+        timings = self.time_calls(get_sharpe_ratio, repeats)
+        results['get_sharpe_ratio_best'] = timings['best']
+        results['get_sharpe_ratio_mean'] = timings['mean']
+
+        self.results['metrics'] = results
+        return results
+
+
+    ################################################################################
+    def run_benchmark(self, name, **kwargs):
+        """
+
+        Run one benchmark in this process, adding its peak memory to its results. The resident memory peak is the
+        process's so far, so it also covers every benchmark run before -- see run_isolated for a benchmark's own
+
+        Parameters:
+        name    (str)   : benchmark name, one of BENCHMARKS
+        kwargs  (dict)  : arguments of the benchmark
+
+        Returns:
+        dict : results of the benchmark
+
+        """
+        if name not in self.BENCHMARKS:
+            raise Exception(f'INVALID BENCHMARK : {name}')
+
+        if self.trace_memory:
+            tracemalloc.start()
+        try:
+            results = getattr(self, f'benchmark_{name}')(**kwargs)
+            if self.trace_memory:
+                results['peak_memory_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+        finally:
+            if self.trace_memory:
+                tracemalloc.stop()
+
+        results['cumulative_max_rss_mb'] = self.get_max_rss_mb()
+        return results
+
+
+    ################################################################################
+    @staticmethod
+    def run_worker(name, seed, cache_path, trace_memory, kwargs):
+        """
+
+        Run one benchmark in a worker process. Should only be used internally as a helper function.
+
+        Parameters:
+        name          (str)   : benchmark name
+        seed          (int)   : random seed for the synthetic data
+        cache_path    (str)   : directory of the synthetic cache
+        trace_memory  (bool)  : record the peak python heap
+        kwargs        (dict)  : arguments of the benchmark
+
+        Returns:
+        dict : results of the benchmark
+
+        """
+        results = TDSBenchmark(seed, cache_path, trace_memory).run_benchmark(name, **kwargs)
+        # the worker runs nothing else, so its peak is the benchmark's own
+        results['max_rss_mb'] = results.pop('cumulative_max_rss_mb')
+        return results
+
+
+    ################################################################################
+    def run_isolated(self, name, **kwargs):
+        """
+
+        Run one benchmark in a new process, so its max_rss_mb is its own peak resident memory rather than the highest
+        of every benchmark run before it. The process shares the synthetic cache
+
+        Parameters:
+        name    (str)   : benchmark name, one of BENCHMARKS
+        kwargs  (dict)  : arguments of the benchmark
+
+        Returns:
+        dict : results of the benchmark
+
+        """
+        if name not in self.BENCHMARKS:
+            raise Exception(f'INVALID BENCHMARK : {name}')
+
+        # spawn rather than fork so the worker starts without this process's memory
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            results = pool.submit(TDSBenchmark.run_worker, name, self.seed, self.cache_path, self.trace_memory, kwargs).result()
+
+        self.results[name] = results
+        return results
+
+
+    ################################################################################
+    @staticmethod
+    def get_max_rss_mb():
+        """
+
+        Get the peak resident memory of the process so far
+
+        Returns:
+        float : megabytes, None where the resource module is unavailable
+
+        """
+        if resource is None:
+            return None
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # bytes on macOS, kilobytes elsewhere
+        return max_rss / 2**20 if sys.platform == 'darwin' else max_rss / 2**10
+
+
+    ################################################################################
+    def get_environment(self):
+        """
+
+        Get what the results depend on besides the code, to tell comparable runs apart
+
+        Returns:
+        dict : versions, machine and benchmark settings
+
+        """
+        return {
+            'time'         : datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'python'       : platform.python_version(),
+            'numpy'        : np.__version__,
+            'pandas'       : pd.__version__,
+            'platform'     : platform.platform(),
+            'cpus'         : os.cpu_count(),
+            'seed'         : self.seed,
+            'trace_memory' : self.trace_memory,
+        }
+
+
+    ################################################################################
+    def dump_results(self, filepath):
+        """
+
+        Save benchmark results to a json
+
+        Parameters:
+        filepath (str) : filepath to output results to
+
+        Returns:
+        None
+
+        """
+        with open(filepath, 'w') as outfile:
+            json.dump({'environment' : self.get_environment(), 'benchmarks' : self.results}, outfile, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the TDS hot paths on synthetic data')
+    parser.add_argument('benchmarks', nargs='*', default=TDSBenchmark.BENCHMARKS, help=f'benchmarks to run, of {TDSBenchmark.BENCHMARKS}')
+    parser.add_argument('--trades', type=int, default=100000, help='number of trades for the make_trade benchmark')
+    parser.add_argument('--days', type=int, default=7, help='number of days for the tick generator benchmark')
+    parser.add_argument('--metric-days', type=int, default=30, help='number of days for the metrics benchmark')
+    parser.add_argument('--repeats', type=int, default=5, help='calls to time per function')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for the synthetic data')
+    parser.add_argument('--memory', action='store_true', help='record each benchmark\'s peak python heap, slows the timings down')
+    parser.add_argument('--in-process', action='store_true', help='run every benchmark in this process, faster but the resident memory peak is cumulative')
+    parser.add_argument('--output', default=None, help='json file to write the results to')
+    args = parser.parse_args()
+
+    kwargs = {
+        'tick_generator' : {'num_days' : args.days},
+        'make_trade'     : {'num_trades' : args.trades, 'repeats' : args.repeats},
+        'market_data'    : {'repeats' : args.repeats},
+        'metrics'        : {'num_days' : args.metric_days, 'repeats' : args.repeats},
+    }
+    benchmark = TDSBenchmark(args.seed, trace_memory=args.memory)
+    try:
+        for name in args.benchmarks:
+            if args.in_process:
+                benchmark.run_benchmark(name, **kwargs.get(name, {}))
+            else:
+                benchmark.run_isolated(name, **kwargs.get(name, {}))
+    finally:
+        benchmark.close()
+
+    print(json.dumps(benchmark.results, indent=2))
+    if args.output is not None:
+        benchmark.dump_results(args.output)
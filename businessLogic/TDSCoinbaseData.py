@@ -1,6 +1,8 @@
 from datetime import datetime, timedelta, timezone
+from functools import reduce
 import requests
 import time
+import numpy as np
 import pandas as pd
 import logging
 import os
@@ -16,6 +18,14 @@ class TDSCoinbaseData:
 ####################################################################################
     
     API_URL = "https://api.pro.coinbase.com/"
+
+    # field order of the aligned market data arrays
+    MARKET_FIELDS = ['open', 'high', 'low', 'close', 'volume']
+
+    # clock join policies for aligning several products
+    JOIN_FIRST = 'first'
+    JOIN_INNER = 'inner'
+    JOIN_OUTER = 'outer'
     
     
     ################################################################################
@@ -318,4 +328,80 @@ class TDSCoinbaseData:
             print(f'Completed in {round(time.time() - start_time, 2)} seconds')
        
         return pd.concat(dfs, ignore_index=True)
-       
+
+
+    ################################################################################
+    def align_to_clock(self, timestamps, values, clock):
+        """
+        
+        Reindex a product's market data onto a clock -- missing rows are filled from the previous close with zero volume
+
+        Parameters: 
+        timestamps  (ndarray)  : sorted timestamps of the product's rows
+        values      (ndarray)  : rows of market data ordered as MARKET_FIELDS
+        clock       (ndarray)  : sorted timestamps to align to
+    
+        Returns: 
+        ndarray : rows of market data, one per clock timestamp
+        
+        """ 
+
+        # index of the last row at or before each clock timestamp
+        pos = np.searchsorted(timestamps, clock, side='right') - 1
+        # rows before the first available row are back filled from it
+        pos = np.maximum(pos, 0)
+        aligned = values[pos]
+
+        gaps = timestamps[pos] != clock
+        if gaps.any():
+            close = aligned[gaps, 3]
+            aligned[gaps, :4] = close[:, np.newaxis]
+            aligned[gaps, 4] = 0
+
+        return aligned
+
+
+    ################################################################################
+    def get_aligned_market_data(self, products, date, interval, join='first'):
+        """
+        
+        Get a single day of market data for several products aligned to a common clock
+
+        Parameters: 
+        products     (list)       : products of data
+        date         (str)        : date of data
+        interval     (int)        : interval of data
+        join         (str)        : clock policy -- 'first' uses the first product's clock, 'inner' the timestamps
+                                    shared by every product and 'outer' the union of all timestamps
+    
+        Returns: 
+        tuple : (timestamps, values) -- int64 array of clock timestamps and a float array of
+                shape (products, timestamps, fields) ordered as MARKET_FIELDS
+        
+        """ 
+
+        product_timestamps = []
+        product_values = []
+
+        for product in products:
+            df = self.get_single_day_market_data(product, date, interval)
+            if len(df) == 0:
+                raise Exception(f'NO MARKET DATA : {product} {date} {interval}')
+            df = df.sort_values('timestamp')
+            product_timestamps.append(df['timestamp'].values.astype('int64'))
+            product_values.append(df[self.MARKET_FIELDS].values.astype('float64'))
+
+        if join == self.JOIN_FIRST:
+            clock = product_timestamps[0]
+        elif join == self.JOIN_INNER:
+            clock = reduce(np.intersect1d, product_timestamps)
+        elif join == self.JOIN_OUTER:
+            clock = reduce(np.union1d, product_timestamps)
+        else:
+            raise Exception(f'INVALID JOIN : {join}')
+
+        values = np.empty((len(products), len(clock), len(self.MARKET_FIELDS)))
+        for i in range(len(products)):
+            values[i] = self.align_to_clock(product_timestamps[i], product_values[i], clock)
+
+        return clock, values
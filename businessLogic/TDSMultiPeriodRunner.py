@@ -0,0 +1,154 @@
+import os
+import time
+import json
+import logging
+import traceback
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from TDSCoinbaseData import TDSCoinbaseData
+from TDSBacktest import TDSBacktest
+
+####################################################################################
+class TDSMultiPeriodRunner:
+####################################################################################
+
+
+    ################################################################################
+    def __init__(self, strategy_factory, periods, products, output_dir, params=None, holdings=None, interval=60,
+                 cache_path='data', backtest_kwargs=None):
+        """
+
+        Run a strategy over several periods at once, one process per period, so the total wall time is the slowest
+        period's rather than the sum. Each period writes its trades file and metrics to output_dir
+
+        Parameters:
+        strategy_factory  (function)  : params -> strategy, called as strategy_factory(**params) in the worker -- must
+                                        be picklable, ex. a strategy class defined at module level
+        periods           (list)      : list of (start_date, end_date) YYYYMMDD periods
+        products          (list)      : products to include in each tick
+        output_dir        (str)       : directory to write the trades files, metrics and summary to
+        params            (dict)      : strategy parameters, the same for every period
+        holdings          (dict)      : starting holdings, 1.0 BTC if None
+        interval          (int)       : tick size
+        cache_path        (str)       : market data cache, each period loads its own dates
+        backtest_kwargs   (dict)      : extra TDSBacktest arguments, ex. tick_gen_kwargs or tracker_kwargs
+
+        """
+        self.strategy_factory = strategy_factory
+        self.periods = periods
+        self.products = products
+        self.output_dir = output_dir
+        self.params = params if params is not None else {}
+        self.holdings = holdings
+        self.interval = interval
+        self.cache_path = cache_path
+        self.backtest_kwargs = backtest_kwargs if backtest_kwargs is not None else {}
+        self.summary = None
+
+
+    ################################################################################
+    @staticmethod
+    def run_period(period, start_date, end_date, strategy_factory, params, products, output_dir, holdings, interval, cache_path, backtest_kwargs):
+        """
+
+        Backtest one period in a worker process and write its outputs. Should only be used internally as a helper function.
+
+        Parameters:
+        period            (int)       : 1 based period number
+        start_date        (str)       : YYYYMMDD start date
+        end_date          (str)       : YYYYMMDD end date
+        strategy_factory  (function)  : params -> strategy
+        params            (dict)      : strategy parameters
+        products          (list)      : products to include in each tick
+        output_dir        (str)       : directory to write to
+        holdings          (dict)      : starting holdings
+        interval          (int)       : tick size
+        cache_path        (str)       : market data cache
+        backtest_kwargs   (dict)      : extra TDSBacktest arguments
+
+        Returns:
+        dict : period, dates, output files, backtest summary and error, None if the run succeeded
+
+        """
+        logging.getLogger().setLevel(logging.ERROR)
+        start = time.perf_counter()
+        name = f'{start_date}_{end_date}'
+        row = {
+            'period'       : period,
+            'start_date'   : start_date,
+            'end_date'     : end_date,
+            'trades_file'  : os.path.join(output_dir, f'trades_{name}.json'),
+            'metrics_file' : os.path.join(output_dir, f'metrics_{name}.json'),
+            'error'        : None,
+        }
+        try:
+            backtest = TDSBacktest(strategy_factory(**params), TDSCoinbaseData(cache_path), products, start_date, end_date,
+                                   holdings=holdings, interval=interval, **backtest_kwargs)
+            backtest.run()
+            row.update(backtest.get_summary())
+            backtest.tracker.dump_trades(row['trades_file'])
+        except Exception as e:
+            row['error'] = f'{e}\n{traceback.format_exc()}'
+        row['run_time'] = time.perf_counter() - start
+
+        with open(row['metrics_file'], 'w') as outfile:
+            json.dump(row, outfile, indent=2, default=float)
+        return row
+
+
+    ################################################################################
+    def run(self):
+        """
+
+        Run every period in parallel and write summary.json and README.txt to output_dir
+
+        Returns:
+        DataFrame : one row per period -- period, dates, output files, every column of TDSBacktest.get_summary,
+                    run_time and error, the exception of a failed period
+
+        """
+        start = time.perf_counter()
+        if not os.path.isdir(self.output_dir):
+            os.makedirs(self.output_dir)
+
+        with ProcessPoolExecutor(len(self.periods)) as pool:
+            futures = [pool.submit(TDSMultiPeriodRunner.run_period, period + 1, start_date, end_date, self.strategy_factory, self.params,
+                                   self.products, self.output_dir, self.holdings, self.interval, self.cache_path, self.backtest_kwargs)
+                       for period, (start_date, end_date) in enumerate(self.periods)]
+            rows = [future.result() for future in futures]
+
+        df = pd.DataFrame(rows)
+        df = pd.concat([df.drop(columns=['error']), df[['error']]], axis=1)
+        self.summary = df
+
+        wall_time = time.perf_counter() - start
+        with open(os.path.join(self.output_dir, 'summary.json'), 'w') as outfile:
+            json.dump({'wall_time' : wall_time, 'params' : self.params, 'periods' : rows}, outfile, indent=2, default=float)
+        with open(os.path.join(self.output_dir, 'README.txt'), 'w') as outfile:
+            outfile.write(self.get_readme_text())
+
+        logging.info(f'{len(self.periods)} periods in {wall_time:.2f}s, {df["run_time"].sum():.2f}s if run one at a time')
+        return df
+
+
+    ################################################################################
+    def get_readme_text(self, team_name='##########'):
+        """
+
+        Fill in the competition README with each period's trades file and sharpe ratio
+
+        Parameters:
+        team_name  (str)  : team name
+
+        Returns:
+        str : README text
+
+        """
+        lines = [f'TEAM NAME:  {team_name}', '']
+        for row in self.summary.to_dict('records'):
+            sharpe = 'FAILED' if isinstance(row['error'], str) else row['sharpe_ratio']
+            lines += [f'PERIOD {row["period"]}:',
+                      f'OUTPUT TRADES FILE  : {os.path.basename(row["trades_file"])}',
+                      f'SHARPE RATIO        : {sharpe}',
+                      '']
+        return '\n'.join(lines) + '\n'
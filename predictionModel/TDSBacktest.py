@@ -0,0 +1,493 @@
+import os
+import time
+import json
+import pickle
+import logging
+import argparse
+import importlib
+from TDSCoinbaseData import TDSCoinbaseData
+from TDSTickGenerator import TDSTickGenerator
+from TDSTransactionTracker import TDSTransactionTracker
+
+####################################################################################
+class TDSBacktestContext:
+####################################################################################
+
+
+    ################################################################################
+    def __init__(self, backtest):
+        """
+
+        What a strategy sees of a running backtest -- trades are made at the current tick, rejected trades are counted
+        per status and strategy state kept in ctx.state
+
+        Parameters:
+        backtest  (TDSBacktest)  : backtest being run
+
+        """
+        self.backtest = backtest
+        self.tracker = backtest.tracker
+        self.tick_gen = backtest.tick_gen
+        self.tick = None
+        self.num_ticks = 0
+        self.state = {}
+        self.stopped = False
+
+        self.trading_time = 0.0
+        self.rejected = {}
+
+
+    ################################################################################
+    def make_trade(self, product, side, size):
+        """
+
+        Make a trade at the current tick, raising on an invalid trade as TDSTransactionTracker.make_trade does
+
+        Parameters:
+        product  (str)    : '<BASE>-<QUOTE>', or a TDSProductHandle
+        side     (str)    : 'buy' or 'sell'
+        size     (float)  : amount of HELD currency to trade, -1 for the entire position
+
+        Returns:
+        dict : trade made
+
+        """
+        start = time.perf_counter()
+        try:
+            return self.tracker.make_trade(self.tick, product, side, size)
+        finally:
+            self.trading_time += time.perf_counter() - start
+
+
+    ################################################################################
+    def try_trade(self, product, side, size):
+        """
+
+        Make a trade at the current tick if it is valid, counting rejections per status
+
+        Parameters:
+        product  (str)    : '<BASE>-<QUOTE>', or a TDSProductHandle
+        side     (str)    : 'buy' or 'sell', or a side code
+        size     (float)  : amount of HELD currency to trade, -1 for the entire position
+
+        Returns:
+        str : TRADE_OK or the reason the trade was rejected
+
+        """
+        start = time.perf_counter()
+        status, i = self.tracker.try_trade(self.tick, product, side, size)
+        self.trading_time += time.perf_counter() - start
+
+        if status != self.tracker.TRADE_OK:
+            self.rejected[status] = self.rejected.get(status, 0) + 1
+        return status
+
+
+    ################################################################################
+    def make_trades(self, legs):
+        """
+
+        Atomically make a multi-leg trade at the current tick, see TDSTransactionTracker.make_trades
+
+        Parameters:
+        legs  (list)  : list of (product, side, size) legs
+
+        Returns:
+        int : group id of the trade
+
+        """
+        start = time.perf_counter()
+        try:
+            return self.tracker.make_trades(self.tick, legs)
+        finally:
+            self.trading_time += time.perf_counter() - start
+
+
+    ################################################################################
+    def get_max_trade_size(self, product, side):
+        """
+
+        Get the largest size make_trade would accept at the current tick
+
+        Parameters:
+        product  (str)  : '<BASE>-<QUOTE>', or a TDSProductHandle
+        side     (str)  : 'buy' or 'sell'
+
+        Returns:
+        float : max amount of HELD currency to trade
+
+        """
+        return self.tracker.get_max_trade_size(self.tick, product, side)
+
+
+    ################################################################################
+    def get_holdings(self):
+        """
+
+        Get the current holdings -- the tracker's own dict, do not modify
+
+        Returns:
+        dict : currency -> amount
+
+        """
+        return self.tracker.holdings
+
+
+    ################################################################################
+    def stop(self):
+        """
+
+        End the backtest after the current tick
+
+        Returns:
+        None
+
+        """
+        self.stopped = True
+
+
+####################################################################################
+class TDSBacktest:
+####################################################################################
+
+    PHASES = ['data', 'strategy', 'trading', 'equity', 'checkpoint']
+
+
+    ################################################################################
+    def __init__(self, strategy, cb_data_obj, products, start_date, end_date, holdings=None, interval=60,
+                 tick_gen_kwargs=None, tracker_kwargs=None, record_equity=False, checkpoint_dir=None, checkpoint_ticks=None,
+                 checkpoint_seconds=None):
+        """
+
+        Event driven backtest -- owns the tick generator, the transaction tracker and the tick loop, calling
+        strategy.on_tick(tick, ctx) once per tick. Strategies may also define on_start(ctx) and on_end(ctx)
+
+        With a checkpoint_dir, trades are streamed to a journal in it and a checkpoint of the generator position,
+        tracker state and strategy state is written every checkpoint_ticks ticks or checkpoint_seconds seconds, see
+        resume. The strategy state is strategy.get_state() if it defines get_state and set_state, otherwise its
+        __dict__ -- either way it must be picklable and hold any random state, ex. a np.random.RandomState
+
+        Parameters:
+        strategy            (object)           : strategy with an on_tick(tick, ctx) method
+        cb_data_obj         (TDSCoinbaseData)  : market data source, a TDSSharedMarketData obj also works
+        products            (list)             : products to include in each tick
+        start_date          (str)              : YYYYMMDD start date
+        end_date            (str)              : YYYYMMDD end date
+        holdings            (dict)             : starting holdings, 1.0 BTC if None
+        interval            (int)              : tick size
+        tick_gen_kwargs     (dict)             : extra TDSTickGenerator arguments, ex. derived_products or filters
+        tracker_kwargs      (dict)             : extra TDSTransactionTracker arguments, ex. fee_tiers or execution_model -- its
+                                                 cb_data_obj defaults to cb_data_obj, shared market data can't value holdings
+        record_equity       (bool)             : pass every tick to the tracker's intraday equity curve
+        checkpoint_dir      (str)              : directory for the journal and checkpoints, None to not checkpoint
+        checkpoint_ticks    (int)              : ticks between checkpoints
+        checkpoint_seconds  (float)            : seconds between checkpoints
+
+        """
+        self.strategy = strategy
+        self.cb_data_obj = cb_data_obj
+        self.products = products
+        self.start_date = start_date
+        self.end_date = end_date
+        self.interval = interval
+        self.record_equity = record_equity
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_ticks = checkpoint_ticks
+        self.checkpoint_seconds = checkpoint_seconds
+
+        self.tick_gen = TDSTickGenerator(cb_data_obj, products, start_date, end_date, interval, **(tick_gen_kwargs or {}))
+        tracker_kwargs = dict(tracker_kwargs or {})
+        tracker_kwargs.setdefault('cb_data_obj', cb_data_obj)
+        self.tracker = TDSTransactionTracker(start_date, end_date, holdings if holdings is not None else {'BTC' : 1.0}, **tracker_kwargs)
+        self.ctx = TDSBacktestContext(self)
+
+        self.timings = {phase : 0.0 for phase in self.PHASES}
+        self.wall_time = 0.0
+
+        if checkpoint_dir is not None and not os.path.isdir(checkpoint_dir):
+            os.makedirs(checkpoint_dir)
+
+
+    ################################################################################
+    def run(self, max_ticks=None):
+        """
+
+        Run the strategy over every tick, or until it calls ctx.stop()
+
+        Parameters:
+        max_ticks  (int)  : stop after this many ticks, None for the whole period
+
+        Returns:
+        dict : results, see get_results
+
+        """
+        ctx = self.ctx
+        tick_gen = self.tick_gen
+        tracker = self.tracker
+        on_tick = self.strategy.on_tick
+        record_equity = self.record_equity
+        perf_counter = time.perf_counter
+
+        data_time = 0.0
+        strategy_time = 0.0
+        equity_time = 0.0
+        trading_time = ctx.trading_time
+
+        checkpointing = self.checkpoint_dir is not None
+        if checkpointing and tracker.journal is None:
+            # a fresh run, a resumed one has already reopened its journal
+            tracker.open_journal(self.get_journal_path())
+            if os.path.exists(self.get_checkpoint_path()):
+                os.remove(self.get_checkpoint_path())
+        next_checkpoint_tick = ctx.num_ticks + self.checkpoint_ticks if self.checkpoint_ticks else float('inf')
+        next_checkpoint_time = perf_counter() + self.checkpoint_seconds if self.checkpoint_seconds else float('inf')
+
+        start = perf_counter()
+        if ctx.num_ticks == 0 and hasattr(self.strategy, 'on_start'):
+            self.strategy.on_start(ctx)
+
+        while not ctx.stopped and (max_ticks is None or ctx.num_ticks < max_ticks):
+            t0 = perf_counter()
+            tick = tick_gen.get_tick()
+            t1 = perf_counter()
+            data_time += t1 - t0
+            if tick is None:
+                break
+
+            ctx.tick = tick
+            on_tick(tick, ctx)
+            t2 = perf_counter()
+            strategy_time += t2 - t1
+            ctx.num_ticks += 1
+
+            if record_equity:
+                tracker.update_equity(tick)
+                equity_time += perf_counter() - t2
+
+            if checkpointing and (ctx.num_ticks >= next_checkpoint_tick or perf_counter() >= next_checkpoint_time):
+                # bank the timings first so the checkpoint carries them
+                self.add_timings(data_time, strategy_time, ctx.trading_time - trading_time, equity_time, perf_counter() - start)
+                data_time = strategy_time = equity_time = 0.0
+                trading_time = ctx.trading_time
+                start = self.write_checkpoint()
+                next_checkpoint_tick = ctx.num_ticks + self.checkpoint_ticks if self.checkpoint_ticks else float('inf')
+                next_checkpoint_time = start + self.checkpoint_seconds if self.checkpoint_seconds else float('inf')
+
+        if hasattr(self.strategy, 'on_end'):
+            self.strategy.on_end(ctx)
+        self.add_timings(data_time, strategy_time, ctx.trading_time - trading_time, equity_time, perf_counter() - start)
+        if checkpointing:
+            self.write_checkpoint()
+
+        results = self.get_results()
+        logging.info(f'backtest {self.start_date} - {self.end_date} : {results["ticks"]} ticks, {results["trades"]} trades in {self.wall_time:.2f}s')
+        return results
+
+
+    ################################################################################
+    def add_timings(self, data_time, strategy_time, trading_time, equity_time, wall_time):
+        """
+
+        Add a stretch of the tick loop to the phase timings. Should only be used internally as a helper function.
+
+        Parameters:
+        data_time      (float)  : seconds generating ticks
+        strategy_time  (float)  : seconds in on_tick, including trading_time
+        trading_time   (float)  : seconds in the tracker's trade calls
+        equity_time    (float)  : seconds updating the equity curve
+        wall_time      (float)  : seconds elapsed
+
+        Returns:
+        None
+
+        """
+        # trades are made from within on_tick, so their time is moved out of the strategy's
+        self.timings['data'] += data_time
+        self.timings['strategy'] += strategy_time - trading_time
+        self.timings['trading'] += trading_time
+        self.timings['equity'] += equity_time
+        self.wall_time += wall_time
+
+
+    ################################################################################
+    def get_journal_path(self):
+        """
+
+        Get the path of the trade journal kept in checkpoint_dir
+
+        Returns:
+        str : journal path
+
+        """
+        return os.path.join(self.checkpoint_dir, 'trades.jsonl')
+
+
+    ################################################################################
+    def get_checkpoint_path(self):
+        """
+
+        Get the path of the latest checkpoint in checkpoint_dir
+
+        Returns:
+        str : checkpoint path
+
+        """
+        return os.path.join(self.checkpoint_dir, 'checkpoint.pkl')
+
+
+    ################################################################################
+    def write_checkpoint(self):
+        """
+
+        Flush the journal and write a checkpoint, replacing the previous one only once it is complete on disk so a
+        crash mid-write leaves the previous checkpoint intact. Should only be used internally as a helper function.
+
+        Returns:
+        float : perf_counter time the checkpoint finished
+
+        """
+        start = time.perf_counter()
+        ctx = self.ctx
+        strategy = self.strategy
+        has_state = hasattr(strategy, 'get_state') and hasattr(strategy, 'set_state')
+        checkpoint = {
+            'tracker'      : self.tracker.get_checkpoint(),
+            'tick_gen'     : self.tick_gen.get_position(),
+            'strategy'     : strategy.get_state() if has_state else strategy.__dict__,
+            'state'        : ctx.state,
+            'num_ticks'    : ctx.num_ticks,
+            'stopped'      : ctx.stopped,
+            'rejected'     : ctx.rejected,
+            'trading_time' : ctx.trading_time,
+            'timings'      : self.timings,
+            'wall_time'    : self.wall_time,
+        }
+
+        path = self.get_checkpoint_path()
+        with open(path + '.tmp', 'wb') as outfile:
+            pickle.dump(checkpoint, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        os.replace(path + '.tmp', path)
+
+        end = time.perf_counter()
+        self.timings['checkpoint'] += end - start
+        self.wall_time += end - start
+        return end
+
+
+    ################################################################################
+    def resume(self):
+        """
+
+        Continue from the latest checkpoint in checkpoint_dir, ex. after a crash -- construct the backtest again with
+        the same arguments and a new strategy, call resume, then run. The run carries on from the tick after the
+        checkpoint and ends with the same trades as an uninterrupted one
+
+        Returns:
+        bool : True if a checkpoint was loaded, False if there is none and run starts from the beginning
+
+        """
+        if self.checkpoint_dir is None:
+            raise Exception('NO CHECKPOINT DIR : the backtest was constructed without a checkpoint_dir')
+        path = self.get_checkpoint_path()
+        if not os.path.exists(path):
+            return False
+
+        with open(path, 'rb') as infile:
+            checkpoint = pickle.load(infile)
+
+        self.tracker.resume_checkpoint(checkpoint['tracker'], self.get_journal_path())
+        self.tick_gen.set_position(checkpoint['tick_gen'])
+        if hasattr(self.strategy, 'get_state') and hasattr(self.strategy, 'set_state'):
+            self.strategy.set_state(checkpoint['strategy'])
+        else:
+            self.strategy.__dict__.update(checkpoint['strategy'])
+
+        ctx = self.ctx
+        ctx.state = checkpoint['state']
+        ctx.num_ticks = checkpoint['num_ticks']
+        ctx.stopped = checkpoint['stopped']
+        ctx.rejected = checkpoint['rejected']
+        ctx.trading_time = checkpoint['trading_time']
+        self.timings = checkpoint['timings']
+        self.wall_time = checkpoint['wall_time']
+
+        logging.info(f'backtest resumed at tick {ctx.num_ticks} with {len(self.tracker.trade_log)} trades')
+        return True
+
+
+    ################################################################################
+    def get_results(self):
+        """
+
+        Get the run statistics of the backtest
+
+        Returns:
+        dict : results
+            ticks          (int)    : ticks passed to the strategy
+            trades         (int)    : trades made
+            rejected       (dict)   : status -> number of trades rejected through ctx.try_trade
+            wall_time      (float)  : seconds spent in run
+            ticks_per_sec  (float)  : ticks / wall_time
+            timings        (dict)   : phase -> seconds, data is tick generation, trading is time in the tracker's
+                                      trade calls, strategy is the rest of on_tick and checkpoint is time writing
+                                      checkpoints
+            holdings       (dict)   : final holdings
+
+        """
+        return {
+            'ticks'         : self.ctx.num_ticks,
+            'trades'        : len(self.tracker.trade_log),
+            'rejected'      : dict(self.ctx.rejected),
+            'wall_time'     : self.wall_time,
+            'ticks_per_sec' : self.ctx.num_ticks / self.wall_time if self.wall_time > 0 else 0.0,
+            'timings'       : dict(self.timings),
+            'holdings'      : self.tracker.get_holdings(),
+        }
+
+
+    ################################################################################
+    def get_summary(self):
+        """
+
+        Get the run statistics and the tracker's metrics as one flat dict, ex. a row of a results table
+
+        Returns:
+        dict : ticks, trades, wall_time, ticks_per_sec, <phase>_time for every phase and every scalar metric of
+               TDSTransactionTracker.get_metrics
+
+        """
+        results = self.get_results()
+        summary = {key : results[key] for key in ['ticks', 'trades', 'wall_time', 'ticks_per_sec']}
+        summary.update({f'{phase}_time' : seconds for phase, seconds in results['timings'].items()})
+        summary.update({key : value for key, value in self.tracker.get_metrics().items() if not isinstance(value, dict)})
+        return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a strategy headless over a period')
+    parser.add_argument('strategy', help='module:class of the strategy, constructed without arguments')
+    parser.add_argument('--products', nargs='+', default=['BTC-USD'], help='products to include in each tick')
+    parser.add_argument('--start', required=True, help='YYYYMMDD start date')
+    parser.add_argument('--end', required=True, help='YYYYMMDD end date')
+    parser.add_argument('--interval', type=int, default=60, help='tick size')
+    parser.add_argument('--cache', default='data', help='market data cache path')
+    parser.add_argument('--output', default=None, help='json file to dump the trades to')
+    parser.add_argument('--checkpoint-dir', default=None, help='directory to journal trades and write checkpoints to')
+    parser.add_argument('--checkpoint-ticks', type=int, default=None, help='ticks between checkpoints')
+    parser.add_argument('--checkpoint-seconds', type=float, default=300.0, help='seconds between checkpoints')
+    parser.add_argument('--resume', action='store_true', help='continue from the latest checkpoint in --checkpoint-dir')
+    args = parser.parse_args()
+
+    module, name = args.strategy.split(':')
+    strategy = getattr(importlib.import_module(module), name)()
+    backtest = TDSBacktest(strategy, TDSCoinbaseData(args.cache), args.products, args.start, args.end, interval=args.interval,
+                           checkpoint_dir=args.checkpoint_dir, checkpoint_ticks=args.checkpoint_ticks, checkpoint_seconds=args.checkpoint_seconds)
+    if args.resume:
+        backtest.resume()
+    results = backtest.run()
+    results['sharpe_ratio'] = backtest.tracker.get_sharpe_ratio()
+    print(json.dumps(results, indent=2))
+    if args.output is not None:
+        backtest.tracker.dump_trades(args.output)
@@ -0,0 +1,191 @@
+import heapq
+import numpy as np
+
+####################################################################################
+class TDSConversionGraph:
+####################################################################################
+
+    # path selection modes
+    SHORTEST = 'shortest'
+    LIQUID = 'liquid'
+
+
+    ################################################################################
+    def __init__(self, products, liquidity=None, mode='shortest', default_quote='USD'):
+        """
+
+        Graph of currencies linked by the products that trade them, used to find and cache conversion paths
+
+        Parameters:
+        products       (list)  : '<BASE>-<QUOTE>' products that can be used for conversions
+        liquidity      (dict)  : product -> liquidity weight, ex. mean daily volume, unlisted products weigh 0
+        mode           (str)   : 'shortest' picks the fewest legs, ties broken by liquidity, 'liquid' picks the
+                                 path whose least liquid leg is most liquid, ties broken by legs
+        default_quote  (str)   : currencies without any product are assumed to be listed against this currency,
+                                 None to require every currency to be linked explicitly
+
+        """
+        if mode not in [self.SHORTEST, self.LIQUID]:
+            raise Exception(f'INVALID MODE : {mode}')
+
+        self.liquidity = liquidity if liquidity is not None else {}
+        self.mode = mode
+        self.default_quote = default_quote
+
+        self.products = []
+        # currency -> list of (neighbour, product, inverted)
+        self.edges = {}
+        # (currency, target) -> list of (product, inverted) legs
+        self.paths = {}
+        # bumped whenever the graph changes so that callers can drop derived caches
+        self.version = 0
+
+        for product in products:
+            self.add_product(product)
+
+
+    ################################################################################
+    def add_product(self, product):
+        """
+
+        Add a product to the graph, dropping cached paths that it could shorten
+
+        Parameters:
+        product  (str)  : '<BASE>-<QUOTE>'
+
+        Returns:
+        None
+
+        """
+        if product in self.products:
+            return
+
+        base, quote = product.split('-')
+        self.products.append(product)
+        # 1 base buys close quote, 1 quote buys 1 / close base
+        self.edges.setdefault(base, []).append((quote, product, False))
+        self.edges.setdefault(quote, []).append((base, product, True))
+
+        self.paths = {}
+        self.version += 1
+
+
+    ################################################################################
+    def get_path(self, currency, target='BTC'):
+        """
+
+        Get the legs that convert a currency into the target currency, searching the graph once per pair
+
+        Parameters:
+        currency  (str)  : currency symbol to convert
+        target    (str)  : currency symbol to convert to
+
+        Returns:
+        list : list of (product, inverted) legs -- the rate is the product of each leg's price, or its inverse if inverted
+
+        """
+        path = self.paths.get((currency, target))
+        if path is not None:
+            return path
+
+        if currency != target and currency not in self.edges and self.default_quote is not None:
+            self.add_product(f'{currency}-{self.default_quote}')
+
+        path = self.search(currency, target)
+        if path is None:
+            raise Exception(f'NO CONVERSION PATH : {currency} -> {target}')
+
+        self.paths[(currency, target)] = path
+        return path
+
+
+    ################################################################################
+    def search(self, currency, target):
+        """
+
+        Best-first search for a conversion path -- both the number of legs and the least liquid leg only get worse as
+        a path grows, so the first path to reach the target is the best one. Should only be used internally as a helper function.
+
+        Parameters:
+        currency  (str)  : currency symbol to convert
+        target    (str)  : currency symbol to convert to
+
+        Returns:
+        list : list of (product, inverted) legs, None if the currencies are not connected
+
+        """
+        def get_key(legs, liquidity):
+            return (legs, -liquidity) if self.mode == self.SHORTEST else (-liquidity, legs)
+
+        # entries are (key, insertion count, currency, legs, least liquid leg) -- the count keeps ties in product order
+        count = 0
+        heap = [(get_key(0, np.inf), count, currency, [], np.inf)]
+        done = set()
+
+        while heap:
+            key, _, node, path, liquidity = heapq.heappop(heap)
+            if node == target:
+                return path
+            if node in done:
+                continue
+            done.add(node)
+
+            for neighbour, product, inverted in self.edges.get(node, []):
+                if neighbour in done:
+                    continue
+                leg_liquidity = min(liquidity, self.liquidity.get(product, 0.0))
+                count += 1
+                heapq.heappush(heap, (get_key(len(path) + 1, leg_liquidity), count, neighbour, path + [(product, inverted)], leg_liquidity))
+
+        return None
+
+
+    ################################################################################
+    def get_products(self, currencies, target='BTC'):
+        """
+
+        Get every product needed to convert a set of currencies
+
+        Parameters:
+        currencies  (list)  : currency symbols to convert
+        target      (str)   : currency symbol to convert to
+
+        Returns:
+        list : products on the conversion paths, in first use order
+
+        """
+        products = []
+        for currency in currencies:
+            for product, inverted in self.get_path(currency, target):
+                if product not in products:
+                    products.append(product)
+        return products
+
+
+    ################################################################################
+    def get_rates(self, currencies, get_prices, target='BTC'):
+        """
+
+        Get conversion rates of several currencies, vectorized over however many prices each product has
+
+        Parameters:
+        currencies  (list)      : currency symbols to convert
+        get_prices  (function)  : product -> float or ndarray of prices, called once per product on the paths
+        target      (str)       : currency symbol to convert to
+
+        Returns:
+        ndarray : (prices, currencies) array of rates, or a (currencies,) array for scalar prices
+
+        """
+        prices = {product : np.asarray(get_prices(product), dtype=np.float64) for product in self.get_products(currencies, target)}
+        # every product is priced over the same dates or ticks
+        shape = max([price.shape for price in prices.values()], key=len, default=())
+
+        rates = np.ones(shape + (len(currencies),))
+        for j, currency in enumerate(currencies):
+            rate = np.ones(shape)
+            for product, inverted in self.get_path(currency, target):
+                rate = rate / prices[product] if inverted else rate * prices[product]
+            rates[..., j] = rate
+
+        return rates
@@ -0,0 +1,125 @@
+import numpy as np
+
+####################################################################################
+class TDSPerformanceMetrics:
+####################################################################################
+
+
+    ################################################################################
+    def __init__(self, tracker):
+        """
+
+        Performance metrics of a TDSTransactionTracker, memoized until its trades or conversion graph change
+
+        Parameters:
+        tracker  (TDSTransactionTracker)  : tracker to measure
+
+        """
+        self.tracker = tracker
+        self.version = None
+        self.results = None
+        self.daily_returns = None
+
+
+    ################################################################################
+    def get_daily_returns(self):
+        """
+
+        Get daily BTC holdings with day over day pct change as a df
+
+        Returns:
+        DataFrame  : df of date, BTC and pct_diff
+
+        """
+        self.compute()
+        return self.daily_returns.copy()
+
+
+    ################################################################################
+    def compute(self):
+        """
+
+        Compute every metric, reusing the previous results if nothing changed since
+
+        Returns:
+        dict : sharpe, sortino and calmar ratios, daily returns, max drawdown, turnover, fees paid and trade counts
+
+        """
+        tracker = self.tracker
+        trade_log = tracker.trade_log
+        # valuation goes through the conversion graph, so adding a product can change every metric
+        version = (trade_log.version, tracker.conversion_graph.version)
+        if self.results is not None and self.version == version:
+            return self.results
+
+        dates = tracker.get_dates()
+        risk_free = tracker.BLOCKFI_LENDING_RATE / 365
+
+        # daily returns, the first day is measured against the initial holdings
+        initial_btc = tracker.get_btc_holdings(tracker.initial_holdings, tracker.start_date)
+        df = tracker.get_btc_holdings_over_time()
+        first = df['BTC'].values[0]
+        df['pct_diff'] = df['BTC'].pct_change().fillna((first - initial_btc) / initial_btc)
+
+        returns = df['pct_diff'].values
+        mean_return = df['pct_diff'].mean()
+        return_std = df['pct_diff'].std()
+        downside_dev = np.sqrt(np.mean(np.minimum(returns - risk_free, 0) ** 2))
+
+        equity = np.concatenate([[initial_btc], df['BTC'].values])
+        max_drawdown = (equity / np.maximum.accumulate(equity) - 1).min()
+        total_return = equity[-1] / equity[0] - 1
+        annual_return = (equity[-1] / equity[0]) ** (365 / len(dates)) - 1
+
+        # value every trade and fee in btc at the EOD prices of its date
+        num_trades = len(trade_log)
+        products = trade_log.get_column('product')
+        sides = trade_log.get_column('side')
+        groups = trade_log.get_column('group')
+        traded_btc = 0.0
+        fees_btc = 0.0
+        if num_trades > 0:
+            product_codes = np.unique(products)
+            legs = [trade_log.products[code].split('-') for code in product_codes]
+            currencies = sorted(set(currency for leg in legs for currency in leg))
+            rates = tracker.get_btc_rates(currencies, dates)
+
+            # base and quote rate column of each product code
+            base_columns = np.zeros(len(trade_log.products), dtype=np.int64)
+            quote_columns = np.zeros(len(trade_log.products), dtype=np.int64)
+            for code, (base, quote) in zip(product_codes, legs):
+                base_columns[code] = currencies.index(base)
+                quote_columns[code] = currencies.index(quote)
+
+            day = np.searchsorted(np.array(dates, dtype=np.int64), trade_log.get_column('date'))
+            day = np.clip(day, 0, len(dates) - 1)
+            base_rates = rates[day, base_columns[products]]
+            quote_rates = rates[day, quote_columns[products]]
+
+            # sizes are in the base currency, fees in the liquidated currency
+            traded_btc = (trade_log.get_column('size') * base_rates).sum()
+            fee_rates = np.where(sides == trade_log.SIDES.index('sell'), base_rates, quote_rates)
+            fees_btc = np.nansum(trade_log.get_column('fee') * fee_rates)
+
+        self.daily_returns = df
+        self.results = {
+            'risk_free_daily_return' : risk_free,
+            'mean_daily_return'      : float(mean_return),
+            'daily_return_std'       : float(return_std),
+            'sharpe_ratio'           : float((mean_return - risk_free) / return_std),
+            'sortino_ratio'          : float((mean_return - risk_free) / downside_dev) if downside_dev > 0 else np.nan,
+            'total_return'           : float(total_return),
+            'annual_return'          : float(annual_return),
+            'max_drawdown'           : float(max_drawdown),
+            'calmar_ratio'           : float(annual_return / -max_drawdown) if max_drawdown < 0 else np.nan,
+            'turnover'               : float(traded_btc / equity[1:].mean()),
+            'fees_paid'              : float(fees_btc),
+            'num_trades'             : num_trades,
+            'num_buys'               : int((sides == trade_log.SIDES.index('buy')).sum()),
+            'num_sells'              : int((sides == trade_log.SIDES.index('sell')).sum()),
+            'num_multi_leg_trades'   : len(np.unique(groups[groups >= 0])),
+            'trades_per_product'     : {trade_log.products[code] : int(count) for code, count in enumerate(np.bincount(products)) if count > 0},
+        }
+        self.version = version
+
+        return self.results
@@ -0,0 +1,216 @@
+from datetime import datetime, timedelta
+import numpy as np
+import logging
+from TDSCoinbaseData import TDSCoinbaseData
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+    logging.info("multiprocessing.shared_memory unavailable -- requires python >= 3.8")
+
+####################################################################################
+class TDSSharedMarketData:
+####################################################################################
+
+    MARKET_FIELDS = TDSCoinbaseData.MARKET_FIELDS
+
+
+    ################################################################################
+    def __init__(self, handle, owner=False):
+        """
+
+        Read-only view of aligned multi-product market data held in shared memory. Build one with create() in the
+        parent process and pass get_handle() to workers, which attach with TDSSharedMarketData(handle). It can be
+        given to TDSTickGenerator in place of a TDSCoinbaseData obj
+
+        Parameters:
+        handle  (dict)  : description of the shared blocks, from get_handle()
+        owner   (bool)  : whether this process created the blocks and is responsible for unlinking them
+
+        """
+        if shared_memory is None:
+            raise Exception('SHARED MEMORY UNAVAILABLE : requires python >= 3.8')
+
+        self.handle = handle
+        self.owner = owner
+        self.products = handle['products']
+        self.interval = handle['interval']
+        self.join = handle['join']
+        self.days = handle['days']
+
+        num_rows = handle['num_rows']
+        self.timestamps_shm = self.attach_block(handle['timestamps_name'], owner)
+        self.values_shm = self.attach_block(handle['values_name'], owner)
+
+        self.timestamps = np.ndarray((num_rows,), dtype=np.int64, buffer=self.timestamps_shm.buf)
+        self.values = np.ndarray((len(self.products), num_rows, len(self.MARKET_FIELDS)), dtype=np.float64, buffer=self.values_shm.buf)
+        if not owner:
+            self.timestamps.flags.writeable = False
+            self.values.flags.writeable = False
+
+
+    ################################################################################
+    @staticmethod
+    def attach_block(name, owner):
+        """
+
+        Attach to an existing shared memory block
+
+        Parameters:
+        name   (str)   : name of the block
+        owner  (bool)  : whether this process created the block
+
+        Returns:
+        SharedMemory : the attached block
+
+        """
+        if owner:
+            return shared_memory.SharedMemory(name=name)
+        # workers must not unlink the block when they exit -- python >= 3.13 can opt out of resource tracking
+        try:
+            return shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            return shared_memory.SharedMemory(name=name)
+
+
+    ################################################################################
+    @classmethod
+    def create(cls, cb_data_obj, products, start_date, end_date, interval, join='first'):
+        """
+
+        Load aligned market data for a date range once and copy it into shared memory
+
+        Parameters:
+        cb_data_obj  (TDSCoinbaseData)  : TDSCoinbaseData obj to load the data with
+        products     (list)             : list of products to load
+        start_date   (str)              : YYYYMMDD start date
+        end_date     (str)              : YYYYMMDD end date
+        interval     (int)              : tick size
+        join         (str)              : clock policy, see TDSCoinbaseData.get_aligned_market_data
+
+        Returns:
+        TDSSharedMarketData : the owning view of the shared data
+
+        """
+        if shared_memory is None:
+            raise Exception('SHARED MEMORY UNAVAILABLE : requires python >= 3.8')
+
+        start_dt = datetime(int(start_date[:4]), int(start_date[4:6]), int(start_date[6:8]))
+        end_dt = datetime(int(end_date[:4]), int(end_date[4:6]), int(end_date[6:8]))
+
+        days = {}
+        day_timestamps = []
+        day_values = []
+        num_rows = 0
+
+        while start_dt <= end_dt:
+            date_str = start_dt.strftime('%Y%m%d')
+            timestamps, values = cb_data_obj.get_aligned_market_data(products, date_str, interval, join)
+            days[date_str] = (num_rows, num_rows + len(timestamps))
+            day_timestamps.append(timestamps)
+            day_values.append(values)
+            num_rows += len(timestamps)
+            start_dt += timedelta(days=1)
+
+        timestamps = np.concatenate(day_timestamps).astype(np.int64)
+        values = np.concatenate(day_values, axis=1)
+
+        # zero sized blocks are not allowed
+        timestamps_shm = shared_memory.SharedMemory(create=True, size=max(timestamps.nbytes, 1))
+        values_shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        np.ndarray(timestamps.shape, dtype=np.int64, buffer=timestamps_shm.buf)[:] = timestamps
+        np.ndarray(values.shape, dtype=np.float64, buffer=values_shm.buf)[:] = values
+
+        handle = {
+            'timestamps_name' : timestamps_shm.name,
+            'values_name'     : values_shm.name,
+            'products'        : list(products),
+            'interval'        : interval,
+            'join'            : join,
+            'days'            : days,
+            'num_rows'        : num_rows,
+        }
+
+        # reattach through the constructor so that every view is built the same way
+        timestamps_shm.close()
+        values_shm.close()
+        return cls(handle, owner=True)
+
+
+    ################################################################################
+    def get_handle(self):
+        """
+
+        Get the picklable description of the shared blocks to pass to worker processes
+
+        Returns:
+        dict : handle for TDSSharedMarketData(handle)
+
+        """
+        return self.handle
+
+
+    ################################################################################
+    def get_aligned_market_data(self, products, date, interval, join='first'):
+        """
+
+        Get a single day of aligned market data -- same interface as TDSCoinbaseData.get_aligned_market_data
+
+        Parameters:
+        products     (list)       : products of data, must have been loaded
+        date         (str)        : date of data
+        interval     (int)        : interval of data
+        join         (str)        : clock policy, must match the loaded data
+
+        Returns:
+        tuple : (timestamps, values) -- views into shared memory when products matches the loaded products,
+                otherwise values is a private copy of the selected products
+
+        """
+        if interval != self.interval or join != self.join:
+            raise Exception(f'INVALID SHARED DATA QUERY : loaded interval {self.interval} join {self.join}, requested interval {interval} join {join}')
+        if date not in self.days:
+            raise Exception(f'DATE NOT LOADED : {date}')
+
+        start, end = self.days[date]
+        timestamps = self.timestamps[start:end]
+
+        if list(products) == self.products:
+            return timestamps, self.values[:, start:end]
+
+        missing = [product for product in products if product not in self.products]
+        if missing:
+            raise Exception(f'PRODUCT NOT LOADED : {missing}')
+        indices = [self.products.index(product) for product in products]
+        return timestamps, self.values[indices, start:end]
+
+
+    ################################################################################
+    def close(self):
+        """
+
+        Detach from the shared blocks -- arrays from this obj must not be used afterwards
+
+        Returns:
+        None
+
+        """
+        self.timestamps = None
+        self.values = None
+        self.timestamps_shm.close()
+        self.values_shm.close()
+
+
+    ################################################################################
+    def unlink(self):
+        """
+
+        Free the shared blocks, called once by the owning process after every worker is done
+
+        Returns:
+        None
+
+        """
+        self.timestamps_shm.unlink()
+        self.values_shm.unlink()
@@ -1,5 +1,7 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from types import SimpleNamespace
+import numpy as np
+import pandas as pd
 
 ####################################################################################
 class TDSTick:
@@ -7,7 +9,7 @@ class TDSTick:
 
 
     ################################################################################
-    def __init__(self, date, timestamp, datetime, interval, data_dict):
+    def __init__(self, date, timestamp, datetime, interval, names, row, bars=None, derived=frozenset()):
         """
 
         A class to hold all of the information contained in a tick -- should not be instantiated directly
@@ -19,27 +21,155 @@ class TDSTick:
         self.datetime = datetime
         self.interval = interval
 
-        self.p = SimpleNamespace()
+        # attribute names in tick.p of the synthesized cross products, which can't be traded
+        self.derived = derived
 
-        for product in list(data_dict.keys()):
+        self.p = self.to_namespace(names, row)
+
+        # partial coarser bars up to and including this tick, keyed by bar interval
+        self.bars = {}
+        if bars is not None:
+            for bar_interval, bar_row in bars.items():
+                self.bars[bar_interval] = self.to_namespace(names, bar_row)
+
+
+    ################################################################################
+    @staticmethod
+    def to_namespace(names, row):
+        """
+
+        Build the per product namespace of a tick
+
+        Parameters: 
+        names  (list)     : attribute name of each product
+        row    (ndarray)  : one (open, high, low, close, volume) entry per product
+    
+        Returns: 
+        SimpleNamespace : namespace of product data
+    
+        """ 
+
+        p = SimpleNamespace()
+
+        for name, (open_, high, low, close, volume) in zip(names, row.tolist()):
 
             tick_data = SimpleNamespace()
 
-            tick_data.open = data_dict[product][timestamp]['open']
-            tick_data.close = data_dict[product][timestamp]['close']
-            tick_data.high = data_dict[product][timestamp]['high']
-            tick_data.low = data_dict[product][timestamp]['low']
-            tick_data.volume = data_dict[product][timestamp]['volume']
-            setattr(self.p, product.replace('-', '_').lower(), tick_data)
+            tick_data.open = open_
+            tick_data.close = close
+            tick_data.high = high
+            tick_data.low = low
+            tick_data.volume = volume
+            setattr(p, name, tick_data)
+
+        return p
+
+
+####################################################################################
+class TDSTickFilter:
+####################################################################################
+
+
+    ################################################################################
+    def __init__(self, mask_func, description):
+        """
+
+        A tick predicate evaluated over a whole day of aligned data as a boolean mask -- ticks outside the mask are never built
+
+        Parameters: 
+        mask_func    (function)  : takes the TDSTickGenerator of the loaded day and returns a bool array, one entry per row
+        description  (str)       : readable description of the predicate
+     
+        """ 
+        self.mask_func = mask_func
+        self.description = description
+
+
+    ################################################################################
+    def get_mask(self, tick_gen):
+        """
+
+        Evaluate the predicate over the day loaded in a tick generator
+
+        Parameters: 
+        tick_gen  (TDSTickGenerator)  : generator with a loaded day
+    
+        Returns: 
+        ndarray : bool array of rows to keep
+    
+        """ 
+        return self.mask_func(tick_gen)
+
+
+    ################################################################################
+    @staticmethod
+    def any_volume(products):
+        """
+
+        Keep ticks where any of the given products traded
+
+        Parameters: 
+        products  (list)  : products to check the volume of
+    
+        Returns: 
+        TDSTickFilter : the filter
+    
+        """ 
+        def mask_func(tick_gen):
+            return np.any([tick_gen.get_field(product, 'volume') > 0 for product in products], axis=0)
+        return TDSTickFilter(mask_func, f'any volume in {products}')
+
+
+    ################################################################################
+    @staticmethod
+    def every_nth(n):
+        """
+
+        Keep every nth tick -- counted from the epoch so that the selection does not depend on the start date
+
+        Parameters: 
+        n  (int)  : tick stride
+    
+        Returns: 
+        TDSTickFilter : the filter
+    
+        """ 
+        def mask_func(tick_gen):
+            return (tick_gen.timestamps // tick_gen.interval) % n == 0
+        return TDSTickFilter(mask_func, f'every {n} ticks')
+
+
+    ################################################################################
+    @staticmethod
+    def hours(start_hour, end_hour):
+        """
+
+        Keep ticks from start_hour (inclusive) to end_hour (exclusive) UTC, wrapping past midnight if start_hour > end_hour
+
+        Parameters: 
+        start_hour  (int)  : first hour to keep
+        end_hour    (int)  : first hour to drop
+    
+        Returns: 
+        TDSTickFilter : the filter
+    
+        """ 
+        def mask_func(tick_gen):
+            hour = (tick_gen.timestamps % 86400) // 3600
+            if start_hour <= end_hour:
+                return (hour >= start_hour) & (hour < end_hour)
+            return (hour >= start_hour) | (hour < end_hour)
+        return TDSTickFilter(mask_func, f'hours {start_hour}-{end_hour} UTC')
+
 
-            
 ####################################################################################
 class TDSTickGenerator:
 ####################################################################################
     
     
     ################################################################################
-    def __init__(self, cb_data_obj, products, start_date, end_date, interval):
+    def __init__(self, cb_data_obj, products, start_date, end_date, interval, join='first', derived_products=None, filters=None,
+                 bar_intervals=None):
         """
 
         Interface to generate tick data
@@ -50,12 +180,43 @@ class TDSTickGenerator:
         start_date   (str)              : YYYYMMDD start date
         end_date     (str)              : YYYYMMDD end date
         interval     (int)              : tick size -- can be one of 60, 300, 900, 3600, 21600, 86400
+        join         (str)              : clock policy -- 'first' follows the first product's timestamps, 'inner' keeps
+                                          timestamps shared by every product and 'outer' keeps all timestamps with gaps filled
+        derived_products  (list/dict)   : cross products synthesized from two listed products, ex. ['ETH-BTC', 'EUR-USD'],
+                                          or a dict of product -> (first leg, second leg) -- for signals only, trading one is rejected as NO MARKET DATA
+        filters      (list)             : TDSTickFilter predicates a tick must pass to be generated
+        bar_intervals  (list)           : coarser bar sizes, ex. [3600, 86400], to attach to each tick as tick.bars[bar_interval]
+                                          -- each must be a multiple of interval and divide a day
      
         """ 
         self.cb_data_obj = cb_data_obj
         self.products = products
         self.end_date = end_date
         self.interval = interval
+        self.join = join
+        self.filters = filters if filters is not None else []
+        self.skipped_ticks = 0
+
+        self.bar_intervals = bar_intervals if bar_intervals is not None else []
+        for bar_interval in self.bar_intervals:
+            if bar_interval % interval != 0 or 86400 % bar_interval != 0:
+                raise Exception(f'INVALID BAR INTERVAL : {bar_interval} with tick interval {interval}')
+
+        # resolve the legs of each derived product once
+        self.derived_products = {}
+        if isinstance(derived_products, dict):
+            for product, (first, second) in derived_products.items():
+                self.check_cross_legs(product, first, second)
+                self.derived_products[product] = (first, second)
+        elif derived_products is not None:
+            for product in derived_products:
+                self.derived_products[product] = self.get_cross_legs(product)
+
+        # attribute names of each product in tick.p
+        self.names = [product.replace('-', '_').lower() for product in list(products) + list(self.derived_products.keys())]
+        if len(set(self.names)) != len(self.names):
+            raise Exception(f'DUPLICATE PRODUCT : {self.names}')
+        self.derived_names = frozenset(self.names[len(products):])
 
         self.setup_date(start_date)
 
@@ -78,23 +239,263 @@ class TDSTickGenerator:
         if date > self.end_date:
             return False
 
-        data_dict = {}
+        timestamps, values = self.cb_data_obj.get_aligned_market_data(self.products, date, self.interval, self.join)
 
-        for product in self.products:
-            prod_df = self.cb_data_obj.get_single_day_market_data(product, date, self.interval)
-            prod_df = prod_df.set_index('timestamp')
-            prod_dict = prod_df.to_dict('index')
-            data_dict[product] = prod_dict
-        
-        self.data_dict = data_dict
-        self.curr_timestamp = min(list(data_dict[self.products[0]].keys()))
-        self.last_timestamp = max(list(data_dict[self.products[0]].keys()))
+        if self.derived_products:
+            derived = [self.derive_values(product, first, second, values) for product, (first, second) in self.derived_products.items()]
+            values = np.concatenate([values, np.stack(derived)])
+
+        # dense row index -- row i of every product lines up with timestamps[i]
+        self.timestamps = timestamps
+        self.datetimes = pd.to_datetime(timestamps, unit='s', utc=True)
+        self.values = values
+
+        # rows that pass every filter, filtered rows are never built into ticks
+        mask = np.ones(len(timestamps), dtype=bool)
+        for tick_filter in self.filters:
+            mask &= tick_filter.get_mask(self)
+        self.rows = np.flatnonzero(mask)
+        self.skipped_ticks += len(timestamps) - len(self.rows)
+
+        self.curr_row = 0
+        self.num_rows = len(self.rows)
+
+        # bars never span days so they restart with the day
+        self.bar_row = -1
+        self.bar_buckets = {bar_interval : None for bar_interval in self.bar_intervals}
+        self.bar_values = {bar_interval : None for bar_interval in self.bar_intervals}
 
         self.curr_date = date
 
         return True
         
 
+    ################################################################################
+    def check_cross_legs(self, product, first, second):
+        """
+
+        Check that two listed products combine into a cross product -- the first leg must contain the cross base and
+        the second leg the cross quote, both against a shared currency
+
+        Parameters: 
+        product  (str)  : '<BASE>-<QUOTE>' cross product
+        first    (str)  : listed product containing the cross base
+        second   (str)  : listed product containing the cross quote
+    
+        Returns: 
+        str : the currency shared by both legs
+    
+        """ 
+
+        if first not in self.products or second not in self.products:
+            raise Exception(f'INVALID CROSS LEGS : {first} and {second} must be listed products')
+
+        base, quote = product.split('-')
+        first_base, first_quote = first.split('-')
+        second_base, second_quote = second.split('-')
+
+        shared = None
+        if base == first_base:
+            shared = first_quote
+        elif base == first_quote:
+            shared = first_base
+
+        if shared is None or {shared, quote} != {second_base, second_quote}:
+            raise Exception(f'INVALID CROSS LEGS : {product} can not be derived from {first} and {second}')
+
+        return shared
+
+
+    ################################################################################
+    def get_cross_legs(self, product):
+        """
+
+        Find two listed products that combine into a cross product, ex. ETH-BTC from ETH-USD and BTC-USD
+
+        Parameters: 
+        product  (str)  : '<BASE>-<QUOTE>' cross product
+    
+        Returns: 
+        tuple : (first leg, second leg)
+    
+        """ 
+
+        for first in self.products:
+            for second in self.products:
+                if first == second:
+                    continue
+                try:
+                    self.check_cross_legs(product, first, second)
+                except Exception:
+                    continue
+                return first, second
+
+        raise Exception(f'NO CROSS RATE : {product} can not be derived from {self.products}')
+
+
+    ################################################################################
+    def derive_values(self, product, first, second, values):
+        """
+
+        Synthesize a day of market data for a cross product from its two legs. Prices are the product of the leg
+        prices and volume is the amount of the cross base that can move through both legs
+
+        Parameters: 
+        product  (str)      : '<BASE>-<QUOTE>' cross product
+        first    (str)      : listed product containing the cross base
+        second   (str)      : listed product containing the cross quote
+        values   (ndarray)  : aligned market data of the listed products
+    
+        Returns: 
+        ndarray : rows of market data for the cross product
+    
+        """ 
+
+        base = product.split('-')[0]
+        shared = self.check_cross_legs(product, first, second)
+        first_values = values[self.products.index(first)]
+        second_values = values[self.products.index(second)]
+
+        # open, high, low, close of the base in the shared currency and of the shared currency in the quote
+        # -- an inverted leg swaps high and low
+        if first.split('-')[0] == base:
+            base_prices = first_values[:, :4]
+            first_shared_volume = first_values[:, 4] * first_values[:, 3]
+        else:
+            base_prices = 1 / first_values[:, [0, 2, 1, 3]]
+            first_shared_volume = first_values[:, 4]
+
+        if second.split('-')[0] == shared:
+            shared_prices = second_values[:, :4]
+            second_shared_volume = second_values[:, 4]
+        else:
+            shared_prices = 1 / second_values[:, [0, 2, 1, 3]]
+            second_shared_volume = second_values[:, 4] * second_values[:, 3]
+
+        derived = np.empty_like(first_values)
+        derived[:, :4] = base_prices * shared_prices
+        derived[:, 4] = np.minimum(first_shared_volume, second_shared_volume) / base_prices[:, 3]
+
+        return derived
+
+
+    ################################################################################
+    def update_bars(self, row):
+        """
+
+        Roll the partial coarser bars forward to a row, folding in every row since the last update including filtered ones
+
+        Parameters: 
+        row  (int)  : row of the day being emitted
+    
+        Returns: 
+        dict : bar interval -> one (open, high, low, close, volume) entry per product
+    
+        """ 
+
+        for bar_interval in self.bar_intervals:
+            bucket = self.timestamps[row] // bar_interval
+            bar = self.bar_values[bar_interval]
+
+            if bucket != self.bar_buckets[bar_interval]:
+                # new bar -- start from its first row in the day
+                start = np.searchsorted(self.timestamps, bucket * bar_interval)
+                bar = None
+                self.bar_buckets[bar_interval] = bucket
+            else:
+                start = self.bar_row + 1
+
+            chunk = self.values[:, start:row + 1]
+            if bar is None:
+                bar = np.empty(self.values.shape[::2])
+                bar[:, 0] = chunk[:, 0, 0]
+                bar[:, 1] = chunk[:, :, 1].max(axis=1)
+                bar[:, 2] = chunk[:, :, 2].min(axis=1)
+                bar[:, 4] = chunk[:, :, 4].sum(axis=1)
+            else:
+                np.maximum(bar[:, 1], chunk[:, :, 1].max(axis=1), out=bar[:, 1])
+                np.minimum(bar[:, 2], chunk[:, :, 2].min(axis=1), out=bar[:, 2])
+                bar[:, 4] += chunk[:, :, 4].sum(axis=1)
+            bar[:, 3] = chunk[:, -1, 3]
+
+            self.bar_values[bar_interval] = bar
+
+        self.bar_row = row
+        return self.bar_values
+
+
+    ################################################################################
+    def get_field(self, product, field):
+        """
+
+        Get a field of a product over every row of the loaded day
+
+        Parameters: 
+        product  (str)  : listed or derived product
+        field    (str)  : one of open, high, low, close, volume
+    
+        Returns: 
+        ndarray : field values, one per row
+    
+        """ 
+        name = product.replace('-', '_').lower()
+        return self.values[self.names.index(name), :, self.cb_data_obj.MARKET_FIELDS.index(field)]
+
+
+    ################################################################################
+    def get_position(self):
+        """
+
+        Get the position of the generator, to continue from later with set_position
+
+        Returns: 
+        dict : date, row within the date, skipped ticks and the partial coarser bars
+    
+        """ 
+        return {
+            'date'          : self.curr_date,
+            'row'           : self.curr_row,
+            'skipped_ticks' : self.skipped_ticks,
+            'bar_row'       : self.bar_row,
+            'bar_buckets'   : dict(self.bar_buckets),
+            'bar_values'    : {bar_interval : None if bar is None else bar.copy() for bar_interval, bar in self.bar_values.items()},
+        }
+
+
+    ################################################################################
+    def set_position(self, position):
+        """
+
+        Move the generator to a position from get_position -- the next tick is the one that followed it
+
+        Parameters: 
+        position  (dict)  : position from get_position
+    
+        Returns: 
+        None
+    
+        """ 
+        self.setup_date(position['date'])
+        self.curr_row = position['row']
+        self.skipped_ticks = position['skipped_ticks']
+        self.bar_row = position['bar_row']
+        self.bar_buckets = dict(position['bar_buckets'])
+        self.bar_values = {bar_interval : None if bar is None else bar.copy() for bar_interval, bar in position['bar_values'].items()}
+
+
+    ################################################################################
+    def get_skipped_ticks(self):
+        """
+
+        Get the number of ticks dropped by filters so far
+
+        Returns: 
+        int : number of skipped ticks
+    
+        """ 
+        return self.skipped_ticks
+
+
     ################################################################################
     def timestamp_to_date(self, timestamp):
         """
@@ -121,16 +522,17 @@ class TDSTickGenerator:
         TDSTick : the next available tick
 
         """ 
-        if self.curr_timestamp > self.last_timestamp:
-            next_date = self.timestamp_to_date(self.curr_timestamp)
+        while self.curr_row >= self.num_rows:
+            next_date = (datetime.strptime(self.curr_date, '%Y%m%d') + timedelta(days=1)).strftime('%Y%m%d')
             cont = self.setup_date(next_date)
             if not cont:
                 return None
         
-        dt = self.data_dict[self.products[0]][self.curr_timestamp]['datetime']
-        tick = TDSTick(self.curr_date, self.curr_timestamp, dt, self.interval, self.data_dict)
+        row = self.rows[self.curr_row]
+        bars = self.update_bars(row) if self.bar_intervals else None
+        tick = TDSTick(self.curr_date, int(self.timestamps[row]), self.datetimes[row], self.interval, self.names, self.values[:, row], bars, self.derived_names)
 
-        self.curr_timestamp += self.interval
+        self.curr_row += 1
 
         return tick
 
@@ -0,0 +1,348 @@
+import json
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+from TDSCoinbaseData import TDSCoinbaseData
+from TDSTransactionTracker import TDSTradeJournal, TDSTradeLog, TDSTransactionTracker
+from TDSExecutionModels import TDSExecutionModel
+
+####################################################################################
+class TDSTradeVerifier:
+####################################################################################
+
+    VIOLATION_COLUMNS = ['trade', 'date', 'timestamp', 'product', 'check', 'message']
+
+
+    ################################################################################
+    def __init__(self, cb_data_obj=None, interval=60, max_taken_vol=0.5, fee_rate=0.0018, rel_tol=1e-6, cumulative_volume=True, fee_tiers=None,
+                 execution_model=None):
+        """
+
+        Vectorized replay of a trades file against market data -- checks every trade the way
+        TDSTransactionTracker.make_trade would have, without a tick generator or a per trade python loop
+
+        Parameters:
+        cb_data_obj    (TDSCoinbaseData)  : market data source, a TDSSharedMarketData obj also works
+        interval       (int)              : tick size the trades were made at
+        max_taken_vol  (float)            : max fraction of a tick's volume a trade can take
+        fee_rate       (float)            : fee as a fraction of the liquidated amount
+        rel_tol        (float)            : relative tolerance of every comparison, trades files round amounts
+        cumulative_volume  (bool)         : cap the volume taken per product across every trade in a tick, as the
+                                            tracker does by default
+        fee_tiers      (list)             : (min usd notional over the tracker's NOTIONAL_WINDOW, fee rate) tiers the
+                                            trades were made with, the trailing notional is summed from the notional
+                                            each trade reports
+        execution_model  (TDSExecutionModel)  : model the trades were priced with, None for the close
+
+        """
+        self.cb_data_obj = cb_data_obj if cb_data_obj is not None else TDSCoinbaseData('data')
+        self.interval = interval
+        self.max_taken_vol = max_taken_vol
+        self.fee_rate = fee_rate
+        self.rel_tol = rel_tol
+        self.cumulative_volume = cumulative_volume
+        self.fee_tiers = sorted(fee_tiers) if fee_tiers is not None else None
+        self.execution_model = execution_model if execution_model is not None else TDSExecutionModel()
+
+
+    ################################################################################
+    @staticmethod
+    def load_trades(filepath):
+        """
+
+        Load trades from a dump_trades json or a trade journal
+
+        Parameters:
+        filepath  (str)  : path of the trades file
+
+        Returns:
+        list : list of trade dicts
+
+        """
+        if filepath.endswith('.jsonl') or filepath.endswith('.parquet'):
+            return TDSTradeJournal.read(filepath)[1]
+        with open(filepath) as infile:
+            return json.load(infile)
+
+
+    ################################################################################
+    def get_market_columns(self, trade_log):
+        """
+
+        Join every trade to the bar of its product at its timestamp, loading each (date, product) once
+
+        Parameters:
+        trade_log  (TDSTradeLog)  : trades to join
+
+        Returns:
+        ndarray : (trades, fields) array ordered as MARKET_FIELDS, NaN where there is no market data
+
+        """
+        dates = trade_log.get_column('date')
+        timestamps = trade_log.get_column('timestamp')
+        products = trade_log.get_column('product')
+
+        market = np.full((len(trade_log), len(TDSCoinbaseData.MARKET_FIELDS)), np.nan)
+
+        # sort trades by (date, product) so that each group is a contiguous slice
+        keys = dates.astype(np.int64) * len(trade_log.products) + products
+        order = np.argsort(keys, kind='stable')
+        starts = np.flatnonzero(np.diff(keys[order], prepend=-1))
+        ends = np.append(starts[1:], len(order))
+
+        for start, end in zip(starts, ends):
+            idx = order[start:end]
+            date = str(dates[idx[0]])
+            product = trade_log.products[products[idx[0]]]
+            try:
+                clock, values = self.cb_data_obj.get_aligned_market_data([product], date, self.interval)
+            except Exception as e:
+                logging.info(f'no market data for {product} {date} : {e}')
+                continue
+
+            # trades must land exactly on a row of the product's own clock
+            rows = np.clip(np.searchsorted(clock, timestamps[idx]), 0, len(clock) - 1)
+            found = clock[rows] == timestamps[idx]
+            market[idx[found]] = values[0, rows[found]]
+
+        return market
+
+
+    ################################################################################
+    def verify(self, trades, initial_holdings=None):
+        """
+
+        Check every trade against market data and the holdings reported by the trade before it
+
+        Parameters:
+        trades            (list)  : list of trade dicts, or a path to load them from
+        initial_holdings  (dict)  : holdings before the first trade, inferred from the first trade if None
+
+        Returns:
+        dict : report
+            valid                 (bool)       : no violations found
+            num_trades            (int)        : number of trades checked
+            num_violations        (int)        : number of violations found
+            violations            (DataFrame)  : one row per violation, see VIOLATION_COLUMNS
+            violations_per_check  (dict)       : number of violations of each check
+            final_holdings        (dict)       : holdings replayed from the initial holdings over every trade
+            reported_holdings     (dict)       : holdings reported by the last trade
+
+        """
+        if isinstance(trades, str):
+            trades = self.load_trades(trades)
+
+        sides = set(trade['side'] for trade in trades)
+        if not sides.issubset(TDSTradeLog.SIDES):
+            raise Exception(f'INVALID SIDE : {sorted(sides.difference(TDSTradeLog.SIDES))}')
+
+        trade_log = TDSTradeLog(max(len(trades), 1))
+        trade_log.extend(trades)
+        num_trades = len(trade_log)
+        if num_trades == 0:
+            holdings = dict(initial_holdings) if initial_holdings is not None else {}
+            return self.get_report(trade_log, [], holdings, holdings)
+
+        # base and quote holdings columns of every trade
+        legs = [product.split('-') for product in trade_log.products]
+        base_codes = np.array([trade_log.get_currency_code(base) for base, quote in legs])
+        quote_codes = np.array([trade_log.get_currency_code(quote) for base, quote in legs])
+        for currency in (initial_holdings or {}):
+            trade_log.get_currency_code(currency)
+        num_currencies = len(trade_log.currencies)
+
+        products = trade_log.get_column('product')
+        sell = trade_log.get_column('side') == TDSTradeLog.SIDES.index('sell')
+        size = trade_log.get_column('size')
+        price = trade_log.get_column('price')
+        timestamps = trade_log.get_column('timestamp')
+        reported = trade_log.get_holdings_matrix()[:, :num_currencies]
+        rows = np.arange(num_trades)
+
+        initial = np.full(num_currencies, np.nan)
+        if initial_holdings is not None:
+            for currency, amount in initial_holdings.items():
+                initial[trade_log.currency_codes[currency]] = amount
+
+        # amounts moved by each trade -- sizes are in the base currency and fees come out of the liquidated amount
+        liq_codes = np.where(sell, base_codes[products], quote_codes[products])
+        aq_codes = np.where(sell, quote_codes[products], base_codes[products])
+        liq_amount = np.where(sell, size, size * price)
+        fee = self.get_fee_rates(trade_log, liq_codes, aq_codes, liq_amount, initial) * liq_amount
+        aq_amount = np.where(sell, (liq_amount - fee) * price, (liq_amount - fee) / price)
+
+        # holdings before each trade are the holdings reported by the trade before it
+        if initial_holdings is None:
+            initial[:] = reported[0]
+            initial[liq_codes[0]] += liq_amount[0]
+            initial[aq_codes[0]] -= aq_amount[0]
+            if abs(initial[aq_codes[0]]) <= self.rel_tol * aq_amount[0]:
+                initial[aq_codes[0]] = np.nan
+        previous = np.vstack([initial, reported[:-1]])
+
+        expected = previous.copy()
+        held = previous[rows, liq_codes]
+        expected[rows, liq_codes] = held - liq_amount
+        expected[rows, aq_codes] = np.nan_to_num(previous[rows, aq_codes]) + aq_amount
+
+        # compare each currency on the scale of the amounts involved, not the difference
+        scale = np.fmax(np.abs(previous), np.abs(reported))
+        scale[rows, liq_codes] = np.fmax(scale[rows, liq_codes], liq_amount)
+        scale[rows, aq_codes] = np.fmax(scale[rows, aq_codes], aq_amount)
+        with np.errstate(invalid='ignore'):
+            mismatched = (np.isnan(expected) != np.isnan(reported)) | (np.abs(expected - reported) > self.rel_tol * scale)
+
+        market = self.get_market_columns(trade_log)
+        open_, high, low, close, volume = [market[:, TDSCoinbaseData.MARKET_FIELDS.index(field)] for field in ['open', 'high', 'low', 'close', 'volume']]
+        # buys are priced from the volume they would move at the close
+        sides = trade_log.get_column('side')
+        with np.errstate(invalid='ignore'):
+            exec_price = self.execution_model.get_prices(sides, np.where(sell, size, liq_amount / close), open_, high, low, close, volume)
+        datetimes = pd.to_datetime(timestamps, unit='s', utc=True)
+        timestamp_dates = np.asarray(datetimes.year * 10000 + datetimes.month * 100 + datetimes.day)
+        reported_fee = trade_log.get_column('fee')
+        not_held = np.isnan(held)
+        no_data = np.isnan(close)
+
+        # volume taken by earlier trades of the same product in the same tick
+        taken = np.zeros(num_trades)
+        if self.cumulative_volume:
+            keys = timestamps * len(trade_log.products) + products
+            order = np.argsort(keys, kind='stable')
+            cumulative = np.cumsum(size[order])
+            starts = np.flatnonzero(np.diff(keys[order], prepend=keys[order][0] - 1))
+            group_start = np.repeat(cumulative[starts] - size[order][starts], np.diff(np.append(starts, num_trades)))
+            taken[order] = cumulative - group_start - size[order]
+        available = np.maximum(volume * self.max_taken_vol - taken, 0.0)
+
+        with np.errstate(invalid='ignore'):
+            checks = [
+                ('INVALID TIMESTAMP', (timestamp_dates != trade_log.get_column('date')) | (np.diff(timestamps, prepend=timestamps[0]) < 0),
+                    lambda i: f'timestamp {timestamps[i]} is not on date {trade_log.get_column("date")[i]} or is out of order'),
+                ('NO MARKET DATA', no_data,
+                    lambda i: f'no {trade_log.products[products[i]]} row at {timestamps[i]}'),
+                ('PRICE MISMATCH', ~no_data & (np.abs(price - exec_price) > self.rel_tol * exec_price),
+                    lambda i: f'traded at {price[i]}, expected {exec_price[i]}'),
+                ('INSUFFICIENT MARKET VOLUME', ~no_data & (size - available > self.rel_tol * volume * self.max_taken_vol),
+                    lambda i: f'attempting to move {size[i]} only {available[i]} available'),
+                ('INSUFFICIENT FUNDS', not_held | (liq_amount - held > self.rel_tol * np.fmax(held, liq_amount)),
+                    lambda i: f'attempted to liquidate {liq_amount[i]} {trade_log.currencies[liq_codes[i]]} only holding {held[i]}'),
+                ('FEE MISMATCH', ~np.isnan(reported_fee) & (np.abs(reported_fee - fee) > self.rel_tol * liq_amount),
+                    lambda i: f'reported fee {reported_fee[i]}, expected {fee[i]}'),
+                ('HOLDINGS MISMATCH', ~not_held & mismatched.any(axis=1),
+                    lambda i: ', '.join(f'{trade_log.currencies[c]} reported {reported[i, c]} expected {expected[i, c]}' for c in np.flatnonzero(mismatched[i]))),
+            ]
+
+        violations = []
+        for check, mask, message in checks:
+            for i in np.flatnonzero(mask):
+                violations.append((i, check, message(i)))
+
+        # replay from the initial holdings, adding up every trade's moves per currency
+        acquired = np.bincount(aq_codes, aq_amount, num_currencies)
+        liquidated = np.bincount(liq_codes, liq_amount, num_currencies)
+        final = np.nan_to_num(initial) + acquired - liquidated
+        # positions liquidated in full come back as round off, bounded by eps * number of terms * amount moved
+        final[np.abs(final) <= np.finfo(float).eps * num_trades * (acquired + liquidated)] = 0.0
+        held_codes = set(np.flatnonzero(~np.isnan(initial))).union(aq_codes)
+        final_holdings = {trade_log.currencies[c] : float(final[c]) for c in range(num_currencies) if c in held_codes}
+
+        return self.get_report(trade_log, violations, final_holdings, trade_log.get_holdings(num_trades - 1))
+
+
+    ################################################################################
+    def get_fee_rates(self, trade_log, liq_codes, aq_codes, liq_amount, initial):
+        """
+
+        Get the fee rate each trade should have paid -- with fee_tiers, the tier of the trailing usd notional recorded
+        by a trade journal, or for trades files without notional the tier whose rate the reported holdings imply. Should
+        only be used internally as a helper function.
+
+        Parameters:
+        trade_log   (TDSTradeLog)  : trades checked
+        liq_codes   (ndarray)      : currency code liquidated by each trade
+        aq_codes    (ndarray)      : currency code acquired by each trade
+        liq_amount  (ndarray)      : amount liquidated by each trade
+        initial     (ndarray)      : holdings before the first trade, NaN where unknown
+
+        Returns:
+        ndarray : fee rate of each trade
+
+        """
+        num_trades = len(trade_log)
+        if self.fee_tiers is None:
+            return np.full(num_trades, self.fee_rate)
+
+        rows = np.arange(num_trades)
+        rates = np.array([rate for volume, rate in self.fee_tiers])
+        notional = trade_log.get_column('notional')
+        if not np.isnan(notional).all():
+            timestamps = trade_log.get_column('timestamp')
+            cumulative = np.concatenate([[0.0], np.cumsum(np.nan_to_num(notional))])
+            window_start = np.searchsorted(timestamps, timestamps - TDSTransactionTracker.NOTIONAL_WINDOW, side='right')
+            trailing = cumulative[rows] - cumulative[np.minimum(window_start, rows)]
+            return rates[np.searchsorted([volume for volume, rate in self.fee_tiers], trailing, side='right') - 1]
+
+        # fee rate = 1 - acquired / acquired before fees, snapped to the closest tier rate
+        sell = trade_log.get_column('side') == TDSTradeLog.SIDES.index('sell')
+        price = trade_log.get_column('price')
+        reported = trade_log.get_holdings_matrix()[:, :len(trade_log.currencies)]
+        previous = np.vstack([np.nan_to_num(initial), np.nan_to_num(reported[:-1])])
+        gross = np.where(sell, liq_amount * price, liq_amount / price)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            implied = 1 - (reported[rows, aq_codes] - previous[rows, aq_codes]) / gross
+        return rates[np.abs(np.nan_to_num(implied)[:, None] - rates).argmin(axis=1)]
+
+
+    ################################################################################
+    def get_report(self, trade_log, violations, final_holdings, reported_holdings):
+        """
+
+        Assemble the verification report -- helper function of verify
+
+        Parameters:
+        trade_log          (TDSTradeLog)  : trades checked
+        violations         (list)         : list of (trade index, check, message)
+        final_holdings     (dict)         : replayed holdings after the last trade
+        reported_holdings  (dict)         : holdings reported by the last trade
+
+        Returns:
+        dict : report, see verify
+
+        """
+        violations = sorted(violations, key=lambda violation: violation[0])
+        dates = trade_log.get_column('date')
+        timestamps = trade_log.get_column('timestamp')
+        products = trade_log.get_column('product')
+
+        df = pd.DataFrame([(int(i), str(dates[i]), int(timestamps[i]), trade_log.products[products[i]], check, message) for i, check, message in violations],
+                          columns=self.VIOLATION_COLUMNS)
+
+        return {
+            'valid'                : len(df) == 0,
+            'num_trades'           : len(trade_log),
+            'num_violations'       : len(df),
+            'violations'           : df,
+            'violations_per_check' : df['check'].value_counts().to_dict(),
+            'final_holdings'       : final_holdings,
+            'reported_holdings'    : reported_holdings,
+        }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Verify a trades file against market data')
+    parser.add_argument('trades', help='dump_trades json or trade journal to verify')
+    parser.add_argument('--holdings', default=None, help='json dict of the holdings before the first trade')
+    parser.add_argument('--cache', default='data', help='market data cache path')
+    parser.add_argument('--interval', type=int, default=60, help='tick size the trades were made at')
+    parser.add_argument('--fee-tiers', default=None, help='json list of [min usd notional, fee rate] tiers')
+    parser.add_argument('--execution-model', default=None, help='json execution model config, see TDSExecutionModel.get_config')
+    args = parser.parse_args()
+
+    verifier = TDSTradeVerifier(TDSCoinbaseData(args.cache), interval=args.interval,
+                                fee_tiers=json.loads(args.fee_tiers) if args.fee_tiers else None,
+                                execution_model=TDSExecutionModel.from_config(json.loads(args.execution_model)) if args.execution_model else None)
+    report = verifier.verify(args.trades, json.loads(args.holdings) if args.holdings else None)
+    print(report['violations'].to_string())
+    print(json.dumps({key : value for key, value in report.items() if key != 'violations'}, indent=2))
@@ -5,9 +5,15 @@ import pandas as pd
 import logging
 import os
 import json
+import copy
+import bisect
+import numpy as np
 import plotly.express as px
+from collections import namedtuple
 from TDSCoinbaseData import TDSCoinbaseData
-from TDSTickGenerator import TDSTickGenerator
+from TDSPerformanceMetrics import TDSPerformanceMetrics
+from TDSConversionGraph import TDSConversionGraph
+from TDSExecutionModels import TDSExecutionModel
 
 try:
     from ipywidgets import IntProgress
@@ -15,165 +21,1685 @@ try:
 except:
     logging.info("running in non-notebook environment")
 
+####################################################################################
+class TDSTradeJournal:
+####################################################################################
+
+    ################################################################################
+    def __init__(self, filepath, header, append=False):
+        """
+
+        Append-only journal of trades. A path ending in .parquet is a directory of parquet files, one per flushed
+        batch, every other path is a JSON Lines file whose first line holds the header. Each flushed batch is
+        complete on disk, so a crash loses at most the trades not yet flushed
+
+        Parameters: 
+        filepath  (str)   : journal path
+        header    (dict)  : tracker settings needed to reconstruct it, see TDSTransactionTracker.get_config
+        append    (bool)  : continue an existing journal instead of starting a new one
+    
+        """ 
+        self.filepath = filepath
+        self.header = header
+        self.is_parquet = filepath.endswith('.parquet')
+        self.num_batches = 0
+
+        if self.is_parquet:
+            os.makedirs(filepath, exist_ok=True)
+            if append:
+                self.num_batches = len([f for f in os.listdir(filepath) if f.startswith('part-')])
+            else:
+                for f in os.listdir(filepath):
+                    if f.startswith('part-'):
+                        os.remove(os.path.join(filepath, f))
+                with open(os.path.join(filepath, 'header.json'), 'w') as outfile:
+                    json.dump(header, outfile)
+            self.outfile = None
+        else:
+            self.outfile = open(filepath, 'a' if append else 'w')
+            if not append:
+                self.outfile.write(json.dumps({'journal' : header}) + '\n')
+                self.outfile.flush()
+
+    ################################################################################
+    def write(self, trades):
+        """
+
+        Write a batch of trades and flush it to disk
+
+        Parameters: 
+        trades  (list)  : list of trade dicts
+    
+        Returns: 
+        None
+    
+        """ 
+        if len(trades) == 0:
+            return
+
+        if self.is_parquet:
+            df = pd.DataFrame.from_records(trades, columns=['date', 'timestamp', 'side', 'size', 'price', 'product', 'holdings', 'group'] + TDSTradeLog.JOURNAL_KEYS)
+            df['group'] = df['group'].fillna(-1).astype('int32')
+            df['holdings'] = [json.dumps(holdings) for holdings in df['holdings']]
+            # write then rename so a partially written batch is never read back
+            path = os.path.join(self.filepath, f'part-{self.num_batches:06d}.parquet')
+            df.to_parquet(path + '.tmp')
+            os.replace(path + '.tmp', path)
+            self.num_batches += 1
+        else:
+            self.outfile.write(''.join([json.dumps(trade) + '\n' for trade in trades]))
+            self.outfile.flush()
+
+    ################################################################################
+    def get_position(self):
+        """
+
+        Get how far the journal has been written, to cut it back to with truncate
+
+        Returns: 
+        int : bytes written for a JSON Lines journal, batches written for a parquet one
+    
+        """ 
+        if self.is_parquet:
+            return self.num_batches
+        return self.outfile.tell()
+
+    ################################################################################
+    @staticmethod
+    def truncate(filepath, position):
+        """
+
+        Cut a closed journal back to a position from get_position, dropping everything written after it
+
+        Parameters: 
+        filepath  (str)  : journal path
+        position  (int)  : position from get_position
+    
+        Returns: 
+        None
+    
+        """ 
+        if filepath.endswith('.parquet'):
+            for f in os.listdir(filepath):
+                if f.startswith('part-') and int(f[5:11]) >= position:
+                    os.remove(os.path.join(filepath, f))
+        else:
+            os.truncate(filepath, position)
+
+    ################################################################################
+    def close(self):
+        """
+
+        Close the journal
+
+        Returns: 
+        None
+    
+        """ 
+        if self.outfile is not None:
+            self.outfile.close()
+            self.outfile = None
+
+    ################################################################################
+    @staticmethod
+    def read(filepath):
+        """
+
+        Read a journal back
+
+        Parameters: 
+        filepath  (str)  : journal path
+    
+        Returns: 
+        tuple : (header, trades) -- header dict and list of trade dicts
+    
+        """ 
+        if filepath.endswith('.parquet'):
+            with open(os.path.join(filepath, 'header.json')) as infile:
+                header = json.load(infile)
+            parts = sorted(f for f in os.listdir(filepath) if f.startswith('part-') and f.endswith('.parquet'))
+            if len(parts) == 0:
+                return header, []
+            df = pd.concat([pd.read_parquet(os.path.join(filepath, part)) for part in parts], ignore_index=True)
+            # journals written before a key was added lack its column
+            journal_keys = [key for key in TDSTradeLog.JOURNAL_KEYS if key in df]
+            columns = {name : df[name].tolist() for name in ['date', 'timestamp', 'side', 'size', 'price', 'product', 'group'] + journal_keys}
+            holdings = [json.loads(h) for h in df['holdings']]
+            trades = []
+            for i in range(len(df)):
+                trade = {name : columns[name][i] for name in ['date', 'timestamp', 'side', 'size', 'price', 'product']}
+                trade['holdings'] = holdings[i]
+                for key in journal_keys:
+                    trade[key] = columns[key][i]
+                if columns['group'][i] >= 0:
+                    trade['group'] = columns['group'][i]
+                trades.append(trade)
+            return header, trades
+
+        with open(filepath) as infile:
+            header = json.loads(infile.readline())['journal']
+            lines = infile.readlines()
+
+        # a crash can leave a partial last line
+        if len(lines) > 0 and not lines[-1].endswith('\n'):
+            lines = lines[:-1]
+        trades = json.loads('[' + ','.join(lines) + ']')
+        return header, trades
+
+
+# precompiled product metadata for TDSTransactionTracker.make_trade_fast
+TDSProductHandle = namedtuple('TDSProductHandle', ['product', 'code', 'base', 'quote', 'base_code', 'quote_code', 'attr'])
+
+# tracker state from TDSTransactionTracker.snapshot
+TDSTrackerSnapshot = namedtuple('TDSTrackerSnapshot', ['holdings', 'num_trades', 'num_groups', 'num_equity', 'equity_ticks', 'taken_volume', 'tick_timestamp',
+                                                       'notional_start', 'notional_volume', 'fee_tier'])
+
+####################################################################################
+class TDSTradeLog:
+####################################################################################
+
+    SIDES = ['buy', 'sell']
+
+    # name, dtype and fill value of each per trade column
+    COLUMNS = [
+        ('date', np.int32, 0),
+        ('timestamp', np.int64, 0),
+        ('product', np.int32, -1),
+        ('side', np.int8, -1),
+        ('size', np.float64, np.nan),
+        ('price', np.float64, np.nan),
+        ('group', np.int32, -1),
+        ('fee', np.float64, np.nan),
+        ('notional', np.float64, np.nan),
+        ('fee_tier', np.int8, -1),
+    ]
+
+    # columns kept in journals but not in the trades file format
+    JOURNAL_KEYS = ['fee', 'notional', 'fee_tier']
+
+    # position of each column in a pending row, see append_coded
+    COLUMN_INDEX = {name : k for k, (name, dtype, fill) in enumerate(COLUMNS)}
+
+    # max pending trades before they are written to the arrays
+    FLUSH_EVERY = 4096
+
+    ################################################################################
+    def __init__(self, capacity=1024):
+        """
+
+        Columnar, growable store of trades -- products and sides are integer coded and holdings after each trade are
+        kept as a row of a currency matrix, NaN for currencies not held at the time
+
+        Parameters: 
+        capacity  (int)  : number of trades to preallocate
+    
+        """ 
+        self.num_trades = 0
+        self.num_groups = 0
+        # bumped on every change so that derived results can be memoized
+        self.version = 0
+        self.capacity = capacity
+
+        self.products = []
+        self.product_codes = {}
+        self.currencies = []
+        self.currency_codes = {}
+        # currency codes in the key order of the holdings dict
+        self.holdings_order = []
+
+        self.columns = {name : np.full(capacity, fill, dtype=dtype) for name, dtype, fill in self.COLUMNS}
+        self.holdings = np.full((capacity, 8), np.nan)
+
+        # trades materialized as dicts so far, extended lazily by get_trades
+        self.trade_dicts = []
+
+        # trades [num_trades - len(pending), num_trades) as tuples of the column values then a copy of the holdings,
+        # written to the arrays together by flush since setting numpy scalars one at a time dominates the cost of a trade
+        self.pending = []
+
+        # a forked log keeps trades [0, offset) in segments of its ancestors' storage, see fork
+        self.offset = 0
+        self.segments = []
+        # trades shared with forks, which must be copied before being overwritten
+        self.shared_trades = 0
+
+    ################################################################################
+    def get_product_code(self, product):
+        """
+
+        Get the integer code of a product, registering it if new
+
+        Parameters: 
+        product  (str)  : '<BASE>-<QUOTE>'
+    
+        Returns: 
+        int : product code
+    
+        """ 
+        code = self.product_codes.get(product)
+        if code is None:
+            code = len(self.products)
+            self.products.append(product)
+            self.product_codes[product] = code
+        return code
+
+    ################################################################################
+    def get_currency_code(self, currency):
+        """
+
+        Get the holdings column of a currency, registering it (and widening the holdings matrix) if new
+
+        Parameters: 
+        currency  (str)  : currency symbol
+    
+        Returns: 
+        int : holdings column
+    
+        """ 
+        code = self.currency_codes.get(currency)
+        if code is None:
+            code = len(self.currencies)
+            self.currencies.append(currency)
+            self.currency_codes[currency] = code
+            if code >= self.holdings.shape[1]:
+                holdings = np.full((self.capacity, 2 * self.holdings.shape[1]), np.nan)
+                holdings[:, :self.holdings.shape[1]] = self.holdings
+                self.holdings = holdings
+        return code
+
+    ################################################################################
+    def grow(self):
+        """
+
+        Double the preallocated capacity
+
+        Returns: 
+        None
+    
+        """ 
+        capacity = 2 * self.capacity
+        for name, dtype, fill in self.COLUMNS:
+            column = np.full(capacity, fill, dtype=dtype)
+            column[:self.capacity] = self.columns[name]
+            self.columns[name] = column
+
+        holdings = np.full((capacity, self.holdings.shape[1]), np.nan)
+        holdings[:self.capacity] = self.holdings
+        self.holdings = holdings
+        self.capacity = capacity
+
+    ################################################################################
+    def flush(self):
+        """
+
+        Write the pending trades to the column arrays and holdings matrix. Should only be used internally as a helper function.
+
+        Returns: 
+        None
+    
+        """ 
+        if len(self.pending) == 0:
+            return
+
+        pending = self.pending
+        self.pending = []
+        end = self.num_trades - self.offset
+        start = end - len(pending)
+        while self.capacity < end:
+            self.grow()
+
+        rows = list(zip(*pending))
+        # dates are parsed once each, a day's trades share one
+        dates = {date : int(date) for date in set(rows[0])}
+        rows[0] = [dates[date] for date in rows[0]]
+        for k, (name, dtype, fill) in enumerate(self.COLUMNS):
+            # most columns hold one value across the buffer, ex. the group of single trades
+            if rows[k].count(rows[k][0]) == len(pending):
+                self.columns[name][start:end] = rows[k][0]
+            else:
+                self.columns[name][start:end] = rows[k]
+
+        # holdings keys are only ever added, so the last trade's keys give the order and any others were dropped since
+        holdings_rows = rows[-1]
+        keys = list(holdings_rows[-1])
+        keys += sorted(set().union(*holdings_rows).difference(keys))
+        codes = [self.get_currency_code(currency) for currency in keys]
+        self.holdings_order = codes + [code for code in self.holdings_order if code not in codes]
+        nan = np.nan
+        for currency, code in zip(keys, codes):
+            self.holdings[start:end, code] = [holdings.get(currency, nan) for holdings in holdings_rows]
+
+    ################################################################################
+    def append(self, date, timestamp, product, side, size, price, holdings, fee=np.nan):
+        """
+
+        Record a trade
+
+        Parameters: 
+        date       (str)    : YYYYMMDD
+        timestamp  (int)    : tick timestamp
+        product    (str)    : '<BASE>-<QUOTE>'
+        side       (str)    : 'buy' or 'sell'
+        size       (float)  : volume moved in the base currency
+        price      (float)  : execution price
+        holdings   (dict)   : holdings after the trade
+        fee        (float)  : fee paid in the liquidated currency
+    
+        Returns: 
+        int : index of the trade
+    
+        """ 
+        return self.append_coded(date, timestamp, self.get_product_code(product), self.SIDES.index(side), size, price, holdings, fee=fee)
+
+    ################################################################################
+    def append_coded(self, date, timestamp, product_code, side_code, size, price, holdings, group=-1, fee=np.nan, notional=np.nan, fee_tier=-1):
+        """
+
+        Record a trade with an already coded product and side
+
+        Parameters: 
+        date          (str)    : YYYYMMDD
+        timestamp     (int)    : tick timestamp
+        product_code  (int)    : code from get_product_code
+        side_code     (int)    : index into SIDES
+        size          (float)  : volume moved in the base currency
+        price         (float)  : execution price
+        holdings      (dict)   : holdings after the trade
+        group         (int)    : group id of a multi-leg trade, -1 for a single trade
+        fee           (float)  : fee paid in the liquidated currency
+        notional      (float)  : usd value of the trade, counted towards the fee tier
+        fee_tier      (int)    : index of the fee tier the trade paid
+    
+        Returns: 
+        int : index of the trade
+    
+        """ 
+        pending = self.pending
+        pending.append((date, timestamp, product_code, side_code, size, price, group, fee, notional, fee_tier, holdings.copy()))
+        self.num_trades += 1
+        self.version += 1
+        if len(pending) == self.FLUSH_EVERY:
+            self.flush()
+        return self.num_trades - 1
+
+    ################################################################################
+    def new_group(self):
+        """
+
+        Reserve a group id for the legs of a multi-leg trade
+
+        Returns: 
+        int : group id
+    
+        """ 
+        self.num_groups += 1
+        return self.num_groups - 1
+
+    ################################################################################
+    def truncate(self, num_trades):
+        """
+
+        Drop every trade from index num_trades on
+
+        Parameters: 
+        num_trades  (int)  : number of trades to keep
+    
+        Returns: 
+        None
+    
+        """ 
+        self.flush()
+        if num_trades < self.offset:
+            self.flatten()
+        if num_trades < self.shared_trades:
+            # forks still read these trades, so write to a private copy
+            self.columns = {name : column.copy() for name, column in self.columns.items()}
+            self.holdings = self.holdings.copy()
+            self.trade_dicts = self.trade_dicts[:num_trades]
+            self.shared_trades = 0
+
+        start = max(num_trades - self.offset, 0)
+        end = self.num_trades - self.offset
+        for name, dtype, fill in self.COLUMNS:
+            self.columns[name][start:end] = fill
+        self.holdings[start:end] = np.nan
+        del self.trade_dicts[num_trades:]
+        truncated = num_trades < self.num_trades
+        self.num_trades = min(self.num_trades, num_trades)
+        self.version += 1
+
+        # the holdings go back to the last kept trade's keys, so appends must see any key added after it as new again
+        if truncated:
+            if self.num_trades == 0:
+                self.holdings_order = []
+            else:
+                self.holdings_order = [self.currency_codes[currency] for currency in self.get_holdings(self.num_trades - 1)]
+
+    ################################################################################
+    def fork(self):
+        """
+
+        Make an independent copy of the log in O(1) -- the fork reads the trades made so far from this log's storage
+        and appends to its own, this log copies its storage first if it ever truncates below the fork point
+
+        Returns: 
+        TDSTradeLog : forked log
+    
+        """ 
+        self.flush()
+        log = TDSTradeLog(64)
+        log.num_trades = self.num_trades
+        log.num_groups = self.num_groups
+        log.products = list(self.products)
+        log.product_codes = dict(self.product_codes)
+        log.currencies = list(self.currencies)
+        log.currency_codes = dict(self.currency_codes)
+        log.holdings_order = list(self.holdings_order)
+        log.holdings = np.full((log.capacity, self.holdings.shape[1]), np.nan)
+
+        log.offset = self.num_trades
+        log.segments = list(self.segments)
+        if self.num_trades > self.offset:
+            log.segments.append((dict(self.columns), self.holdings, self.trade_dicts, self.offset, self.num_trades))
+        self.shared_trades = self.num_trades
+        return log
+
+    ################################################################################
+    def flatten(self):
+        """
+
+        Write the pending trades and copy the trades a forked log reads from its ancestors into its own storage, so
+        that it can be read as a whole
+
+        Returns: 
+        None
+    
+        """ 
+        self.flush()
+        if self.offset == 0:
+            return
+
+        capacity = self.num_trades + self.capacity
+        width = max([self.holdings.shape[1]] + [segment[1].shape[1] for segment in self.segments])
+        columns = {name : np.full(capacity, fill, dtype=dtype) for name, dtype, fill in self.COLUMNS}
+        holdings = np.full((capacity, width), np.nan)
+        trade_dicts = []
+
+        own = (self.columns, self.holdings, self.trade_dicts, self.offset, self.num_trades)
+        for segment_columns, segment_holdings, segment_dicts, start, end in self.segments + [own]:
+            for name in columns:
+                columns[name][start:end] = segment_columns[name][:end - start]
+            holdings[start:end, :segment_holdings.shape[1]] = segment_holdings[:end - start]
+            # materialized dicts are only kept while they cover every trade before them
+            if len(trade_dicts) == start:
+                trade_dicts.extend(segment_dicts[:end - start])
+
+        self.columns = columns
+        self.holdings = holdings
+        self.trade_dicts = trade_dicts
+        self.capacity = capacity
+        self.offset = 0
+        self.segments = []
+
+    ################################################################################
+    def get_holdings(self, i):
+        """
+
+        Get the holdings dict after a trade
+
+        Parameters: 
+        i  (int)  : index of the trade
+    
+        Returns: 
+        dict : holdings after the trade
+    
+        """ 
+        if i < self.offset:
+            self.flatten()
+        elif i >= self.num_trades - len(self.pending):
+            self.flush()
+        row = self.holdings[i - self.offset].tolist()
+        currencies = self.currencies
+        return {currencies[code] : row[code] for code in self.holdings_order if row[code] == row[code]}
+
+    ################################################################################
+    def get_trades(self):
+        """
+
+        Materialize the trade history in the list of dicts format, converting only trades added since the last call
+
+        Returns: 
+        list : list of trade dicts
+    
+        """ 
+        self.flatten()
+        if len(self.trade_dicts) < self.num_trades:
+            self.trade_dicts.extend(self.get_trade_dicts(len(self.trade_dicts), self.num_trades))
+
+        return self.trade_dicts
+
+    ################################################################################
+    def get_trade_dicts(self, start, end, include_journal_keys=False):
+        """
+
+        Convert a range of trades to the list of dicts format
+
+        Parameters: 
+        start        (int)   : index of the first trade
+        end          (int)   : index after the last trade
+        include_journal_keys  (bool)  : add the JOURNAL_KEYS, which are not part of the trades file format
+    
+        Returns: 
+        list : list of trade dicts
+    
+        """ 
+        if start < self.offset:
+            self.flatten()
+        self.flush()
+        trades = []
+        columns = {name : self.columns[name][start - self.offset:end - self.offset].tolist() for name, dtype, fill in self.COLUMNS}
+        for j in range(end - start):
+            trade = {
+                'date'      : str(columns['date'][j]),
+                'timestamp' : columns['timestamp'][j],
+                'side'      : self.SIDES[columns['side'][j]],
+                'size'      : columns['size'][j],
+                'price'     : columns['price'][j],
+                'product'   : self.products[columns['product'][j]],
+                'holdings'  : self.get_holdings(start + j),
+            }
+            # legs of a multi-leg trade share a group id
+            if columns['group'][j] >= 0:
+                trade['group'] = columns['group'][j]
+            if include_journal_keys:
+                for key in self.JOURNAL_KEYS:
+                    trade[key] = columns[key][j]
+            trades.append(trade)
+
+        return trades
+
+    ################################################################################
+    def extend(self, trades):
+        """
+
+        Bulk load trades in the list of dicts format
+
+        Parameters: 
+        trades  (list)  : list of trade dicts
+    
+        Returns: 
+        None
+    
+        """ 
+        self.flatten()
+        start = self.num_trades
+        end = start + len(trades)
+        while self.capacity < end:
+            self.grow()
+
+        columns = self.columns
+        columns['date'][start:end] = [int(trade['date']) for trade in trades]
+        columns['timestamp'][start:end] = [trade['timestamp'] for trade in trades]
+        columns['product'][start:end] = [self.get_product_code(trade['product']) for trade in trades]
+        columns['side'][start:end] = [self.SIDES.index(trade['side']) for trade in trades]
+        columns['size'][start:end] = [trade['size'] for trade in trades]
+        columns['price'][start:end] = [trade['price'] for trade in trades]
+        columns['group'][start:end] = [trade.get('group', -1) for trade in trades]
+        fills = {name : fill for name, dtype, fill in self.COLUMNS}
+        for key in self.JOURNAL_KEYS:
+            columns[key][start:end] = [trade.get(key, fills[key]) for trade in trades]
+
+        # loaded trades can come from trackers holding different currencies, so key on the currencies themselves
+        keys = None
+        for i, trade in enumerate(trades):
+            holdings = trade['holdings']
+            if tuple(holdings) != keys:
+                keys = tuple(holdings)
+                codes = [self.get_currency_code(currency) for currency in keys]
+                self.holdings_order = codes + [code for code in self.holdings_order if code not in codes]
+            row = self.holdings[start + i]
+            for currency, amount in holdings.items():
+                row[self.currency_codes[currency]] = amount
+
+        self.num_groups = max(self.num_groups, int(columns['group'][:end].max()) + 1 if end > 0 else 0)
+        self.num_trades = end
+        self.version += 1
+
+        # the dicts are already in the materialized format once journal only keys are dropped
+        if len(self.trade_dicts) == start:
+            self.trade_dicts.extend([{key : value for key, value in trade.items() if key not in self.JOURNAL_KEYS} for trade in trades])
+
+    ################################################################################
+    def extend_columns(self, dates, timestamps, product_codes, side_codes, sizes, prices, holdings, currencies, fees=None,
+                       notionals=None, fee_tiers=None):
+        """
+
+        Bulk load trades from columns, ex. trades computed with numpy
+
+        Parameters: 
+        dates          (ndarray)  : YYYYMMDD int date of each trade
+        timestamps     (ndarray)  : tick timestamp of each trade
+        product_codes  (ndarray)  : code from get_product_code of each trade
+        side_codes     (ndarray)  : index into SIDES of each trade
+        sizes          (ndarray)  : volume moved in the base currency by each trade
+        prices         (ndarray)  : execution price of each trade
+        holdings       (ndarray)  : (trades, currencies) holdings after each trade, NaN for currencies not held
+        currencies     (list)     : currency of each holdings column, in holdings dict key order
+        fees           (ndarray)  : fee paid by each trade in the liquidated currency
+        notionals      (ndarray)  : usd notional of each trade, only tracked with fee tiers
+        fee_tiers      (ndarray)  : fee tier of each trade, tier 0 -- the flat fee -- if None
+    
+        Returns: 
+        None
+    
+        """ 
+        self.flatten()
+        start = self.num_trades
+        end = start + len(sizes)
+        while self.capacity < end:
+            self.grow()
+
+        columns = self.columns
+        columns['date'][start:end] = dates
+        columns['timestamp'][start:end] = timestamps
+        columns['product'][start:end] = product_codes
+        columns['side'][start:end] = side_codes
+        columns['size'][start:end] = sizes
+        columns['price'][start:end] = prices
+        columns['group'][start:end] = -1
+        if fees is not None:
+            columns['fee'][start:end] = fees
+        if notionals is not None:
+            columns['notional'][start:end] = notionals
+        columns['fee_tier'][start:end] = 0 if fee_tiers is None else fee_tiers
+
+        codes = [self.get_currency_code(currency) for currency in currencies]
+        self.holdings[start:end] = np.nan
+        self.holdings[start:end, codes] = holdings
+        self.holdings_order = self.holdings_order + [code for code in codes if code not in self.holdings_order]
+
+        self.num_trades = end
+        self.version += 1
+
+    ################################################################################
+    def get_column(self, name):
+        """
+
+        Get a column over every recorded trade
+
+        Parameters: 
+        name  (str)  : column name, see COLUMNS
+    
+        Returns: 
+        ndarray : view of the column
+    
+        """ 
+        self.flatten()
+        return self.columns[name][:self.num_trades]
+
+    ################################################################################
+    def get_value(self, name, i):
+        """
+
+        Get a single column value of a trade
+
+        Parameters: 
+        name  (str)  : column name, see COLUMNS
+        i     (int)  : index of the trade
+    
+        Returns: 
+        scalar : column value
+    
+        """ 
+        j = i - (self.num_trades - len(self.pending))
+        if j >= 0:
+            # read pending trades in place, ex. the trade make_trade just made, rather than flushing one at a time
+            value = self.pending[j][self.COLUMN_INDEX[name]]
+            return int(value) if name == 'date' else value
+        if i < self.offset:
+            # read through to the ancestor segment rather than flattening
+            for columns, holdings, trade_dicts, start, end in self.segments:
+                if i < end:
+                    return columns[name][i - start]
+        return self.columns[name][i - self.offset]
+
+    ################################################################################
+    def get_holdings_matrix(self):
+        """
+
+        Get the holdings after every recorded trade, one column per currency code
+
+        Returns: 
+        ndarray : view of the holdings matrix, NaN for currencies not held
+    
+        """ 
+        self.flatten()
+        return self.holdings[:self.num_trades]
+
+    ################################################################################
+    def __len__(self):
+        return self.num_trades
+
+
 ####################################################################################
 class TDSTransactionTracker:
 ####################################################################################
     
-    BLOCKFI_LENDING_RATE = 0.06
+    BLOCKFI_LENDING_RATE = 0.06
+
+    # fiat is valued through its btc market, any other currency through its usd market, see TDSConversionGraph
+    DEFAULT_CONVERSION_PRODUCTS = ['BTC-USD', 'BTC-EUR', 'BTC-GBP']
+
+    # trailing period of usd notional that sets the fee tier
+    NOTIONAL_WINDOW = 30 * 86400
+
+    # side codes for make_trade_fast
+    BUY = 0
+    SELL = 1
+    SIDE_CODES = {'buy' : BUY, 'sell' : SELL}
+
+    # trade statuses of check_trade and try_trade
+    TRADE_OK = 'OK'
+    INVALID_SIDE = 'INVALID SIDE'
+    NO_MARKET_DATA = 'NO MARKET DATA'
+    INSUFFICIENT_FUNDS = 'INSUFFICIENT FUNDS'
+    INSUFFICIENT_VOLUME = 'INSUFFICIENT MARKET VOLUME'
+    
+    ################################################################################
+    def __init__(self, start_date, end_date, holdings, max_taken_vol=0.5, fee_rate=0.0018, cb_data_obj=None, equity_every=1,
+                 conversion_products=None, cumulative_volume=True, fee_tiers=None, execution_model=None):
+        """
+
+        Interface to make and track trades
+
+        Parameters: 
+        start_date     (str)    : YYYYMMDD start date 
+        end_date       (str)    : YYYYMMDD end date
+        holdings       (dict)   : initial holdings dict
+        max_taken_vol  (float)  : Max pct of volume that can be taken in a given tick
+        fee_rate       (float)  : Fee rate per transaction
+        cb_data_obj    (TDSCoinbaseData)  : data source for EOD valuation, defaults to a TDSCoinbaseData cached in 'data'
+        equity_every   (int)    : record the intraday equity curve every n ticks passed to update_equity
+        conversion_products  (list)  : products to value holdings in btc through, defaults to DEFAULT_CONVERSION_PRODUCTS
+        cumulative_volume    (bool)  : cap the volume taken per product across every trade in a tick, False checks each
+                                       trade against max_taken_vol on its own
+        fee_tiers            (list)  : (min usd notional over NOTIONAL_WINDOW, fee rate) tiers replacing the flat
+                                       fee_rate, the first tier must start at 0
+        execution_model      (TDSExecutionModel) : prices fills from the trade's size and bar, ex. slippage or market
+                                                   impact, None to fill at the close
+    
+        """ 
+        self.start_date = start_date
+        self.end_date = end_date
+        self.trade_log = TDSTradeLog()
+        self.holdings = holdings
+        self.max_taken_vol = max_taken_vol
+        self.fee_rate = fee_rate
+        self.initial_holdings = self.holdings.copy()
+
+        # product code -> base volume taken by trades at tick_timestamp
+        self.cumulative_volume = cumulative_volume
+        self.taken_volume = {}
+        self.tick_timestamp = None
+
+        # tiered fees -- the usd notional of trades [notional_start, num_trades) of the trade log is the trailing
+        # NOTIONAL_WINDOW volume, trades leave from the front as they age out and join at the back as they are made
+        self.fee_tiers = sorted(fee_tiers) if fee_tiers is not None else None
+        if self.fee_tiers is not None:
+            if len(self.fee_tiers) == 0 or self.fee_tiers[0][0] != 0:
+                raise Exception(f'INVALID FEE TIERS : the first tier must start at 0 -- {fee_tiers}')
+            self.fee_tier_volumes = [volume for volume, rate in self.fee_tiers]
+            self.fee_rate = self.fee_tiers[0][1]
+        self.fee_tier = 0
+        self.notional_start = 0
+        self.notional_volume = 0.0
+        # currency -> last usd rate seen on a tick
+        self.usd_rates = {}
+
+        self.execution_model = execution_model
+
+        # product -> TDSProductHandle
+        self.products = {}
+
+        self.cb_data_obj = cb_data_obj
+        # product -> {date : EOD close}
+        self.daily_closes = {}
+        self.conversion_graph = TDSConversionGraph(conversion_products if conversion_products is not None else self.DEFAULT_CONVERSION_PRODUCTS)
+
+        # streaming journal, see open_journal
+        self.journal = None
+
+        # intraday btc equity curve, see update_equity
+        self.equity_every = equity_every
+        self.equity_ticks = 0
+        self.num_equity = 0
+        self.equity_timestamps = np.zeros(1024, dtype=np.int64)
+        self.equity_values = np.zeros(1024)
+        # a fork keeps points [0, equity_offset) in segments of its ancestors' arrays, see fork
+        self.equity_offset = 0
+        self.equity_segments = []
+        # points shared with forks, which must be copied before being overwritten
+        self.equity_shared = 0
+        # (currency, target) -> list of (tick attribute, inverted) legs, for conversion graph version tick_rate_paths_version
+        self.tick_rate_paths = {}
+        self.tick_rate_paths_version = None
+
+        # memoized performance metrics, see get_metrics
+        self.metrics = TDSPerformanceMetrics(self)
+
+    ################################################################################
+    def get_holdings(self):
+        """ 
+
+        Retrieve the current holding dictionary. 
+    
+        Returns: 
+        dict: current holdings 
+    
+        """ 
+        return self.holdings
+        
+    ################################################################################
+    def get_trades(self):
+        """
+
+        Retrieve the current trade history 
+    
+        Returns: 
+        list: list of current trade history 
+    
+        """ 
+        return self.trade_log.get_trades()
+    
+    ################################################################################
+    def get_max_taken_volume(self):
+        """
+
+        Retrieve the max taken volume (max pct of volume that can be taken in a single tick)
+    
+        Returns: 
+        float: max take volume 
+    
+        """ 
+        return self.max_taken_vol
+    
+    ################################################################################
+    def make_trade(self, tick, product, side, size):
+        """
+
+        Attempt to make a trade. Error if attempted trade is invalid, otherwise return the trade record
+
+        Parameters: 
+        tick    (TDSTick)  : current tick 
+        product (str)      : '<BASE>-<QUOTE>', or a TDSProductHandle
+        side    (str)      : 'buy' or 'sell', or a side code
+        size    (float)    : Amount of HELD currency to trade 
+    
+        Returns: 
+        dict: record of the single trade 
+    
+        """ 
+
+        if isinstance(side, str):
+            side_code = self.SIDE_CODES.get(side.lower())
+            if side_code is None:
+                # check if side is invalid
+                raise Exception(f'INVALID SIDE : {side.lower()}')
+        else:
+            # an invalid side code is rejected by check_trade
+            side_code = side
+
+        if isinstance(product, TDSProductHandle):
+            handle = product
+        else:
+            handle = self.products.get(product)
+            if handle is None:
+                handle = self.register_product(product)
+
+        i = self.make_trade_fast(tick, handle, side_code, size)
+
+        # create the trade record
+        trade = {
+            'date'      : tick.date,
+            'timestamp' : tick.timestamp,
+            'side'      : self.trade_log.SIDES[side_code],
+            'size'      : float(self.trade_log.get_value('size', i)),
+            'price'     : float(self.trade_log.get_value('price', i)),
+            'product'   : handle.product,
+            'holdings'  : self.holdings.copy(),
+         }
+
+        return trade
+
+    ################################################################################
+    def register_product(self, product):
+        """
+
+        Precompile a product into a handle for make_trade_fast
+
+        Parameters: 
+        product (str)      : '<BASE>-<QUOTE>' 
+    
+        Returns: 
+        TDSProductHandle: product handle 
+    
+        """ 
+        handle = self.products.get(product)
+        if handle is not None:
+            return handle
+
+        base, quote = product.split('-')
+        handle = TDSProductHandle(
+            product=product,
+            code=self.trade_log.get_product_code(product),
+            base=base,
+            quote=quote,
+            base_code=self.trade_log.get_currency_code(base),
+            quote_code=self.trade_log.get_currency_code(quote),
+            attr=product.lower().replace('-', '_'),
+        )
+        self.products[product] = handle
+        return handle
+
+    ################################################################################
+    def make_trade_fast(self, tick, handle, side, size):
+        """
+
+        Attempt to make a trade with a precompiled product handle and side code. Same rules and errors as make_trade.
+        A tracker without fee_tiers, an execution_model or a journal takes a lean path skipping their bookkeeping
+
+        Parameters: 
+        tick    (TDSTick)           : current tick 
+        handle  (TDSProductHandle)  : handle from register_product 
+        side    (int)               : BUY or SELL
+        size    (float)             : Amount of HELD currency to trade 
+    
+        Returns: 
+        int: index of the trade in the trade log 
+    
+        """ 
+        if self.fee_tiers is not None or self.execution_model is not None or self.journal is not None:
+            i = self.execute_trade(tick, handle, side, size, self.holdings)
+            if self.journal is not None:
+                self.update_journal()
+            return i
+
+        # lean path of execute_trade for a close fill at a flat fee, any trade it can't make goes through
+        # execute_trade to raise the same error
+        holdings = self.holdings
+        buy = side == self.BUY
+        if buy:
+            liq_instr = handle.quote
+            aq_instr = handle.base
+        elif side == self.SELL:
+            liq_instr = handle.base
+            aq_instr = handle.quote
+        else:
+            return self.execute_trade(tick, handle, side, size, holdings)
+
+        held = holdings.get(liq_instr)
+        product_info = getattr(tick.p, handle.attr, None)
+        if held is None or product_info is None or handle.attr in tick.derived:
+            return self.execute_trade(tick, handle, side, size, holdings)
+
+        exec_price = product_info.close
+        available_volume = product_info.volume * self.max_taken_vol
+        if self.cumulative_volume:
+            if tick.timestamp != self.tick_timestamp:
+                self.tick_timestamp = tick.timestamp
+                self.taken_volume = {}
+            available_volume = max(available_volume - self.taken_volume.get(handle.code, 0.0), 0.0)
+
+        size_to_liq = held if size < 0 else size
+        volume_moving = size_to_liq / exec_price if buy else size_to_liq
+        if size_to_liq > held or available_volume < volume_moving:
+            return self.execute_trade(tick, handle, side, size, holdings)
+
+        holdings[liq_instr] = held - size_to_liq
+        fee = self.fee_rate * size_to_liq
+        size_to_liq -= fee
+        holdings[aq_instr] = holdings.get(aq_instr, 0) + (size_to_liq / exec_price if buy else size_to_liq * exec_price)
+
+        if self.cumulative_volume:
+            self.taken_volume[handle.code] = self.taken_volume.get(handle.code, 0.0) + volume_moving
+
+        return self.trade_log.append_coded(tick.date, tick.timestamp, handle.code, side, volume_moving, exec_price, holdings, -1, fee, np.nan, 0)
+
+    ################################################################################
+    def start_tick(self, tick):
+        """
+
+        Start the taken volume ledger over and age trades out of the fee tier window once a new tick is traded on.
+        Should only be used internally as a helper function.
+
+        Parameters: 
+        tick  (TDSTick)  : current tick 
+    
+        Returns: 
+        None
+    
+        """ 
+        if tick.timestamp != self.tick_timestamp:
+            self.tick_timestamp = tick.timestamp
+            self.taken_volume = {}
+            if self.fee_tiers is not None:
+                self.update_fee_tier(tick.timestamp)
+
+    ################################################################################
+    def check_trade(self, tick, handle, side, size, holdings):
+        """
+
+        Validate a trade without applying it or changing any state -- the one rule set behind make_trade, try_trade,
+        make_trades and get_max_trade_size
+
+        Parameters: 
+        tick      (TDSTick)           : current tick 
+        handle    (TDSProductHandle)  : handle from register_product 
+        side      (int)               : BUY or SELL
+        size      (float)             : Amount of HELD currency to trade, None to get the max executable size
+        holdings  (dict)              : holdings to trade from
+    
+        Returns: 
+        tuple : (status, size_to_liq, volume_moving, exec_price, error) -- error describes a status other than
+                TRADE_OK, size_to_liq is the max executable size when size is None
+    
+        """ 
+
+        if side == self.SELL:
+            liq_instr = handle.base
+        elif side == self.BUY:
+            liq_instr = handle.quote
+        else:
+            return self.INVALID_SIDE, 0.0, 0.0, np.nan, f'INVALID SIDE : {side}'
+
+        held = holdings.get(liq_instr)
+        if held is None:
+            # ensure holding enough funds to execute
+            return self.INSUFFICIENT_FUNDS, 0.0, 0.0, np.nan, f'INSIFFICIENT FUNDS : Not holding any {liq_instr}'
+
+        product_info = getattr(tick.p, handle.attr, None)
+        if product_info is None:
+            return self.NO_MARKET_DATA, 0.0, 0.0, np.nan, f'NO MARKET DATA : {handle.product} not in tick'
+        if handle.attr in tick.derived:
+            # a synthesized cross has no market of its own to trade against
+            return self.NO_MARKET_DATA, 0.0, 0.0, np.nan, f'NO MARKET DATA : {handle.product} is derived, not tradable'
+
+        # execute at the close price, or the execution model's price once the size is known
+        exec_price = product_info.close
+        available_volume = product_info.volume * self.max_taken_vol
+
+        # nothing is taken yet on a tick start_tick hasn't seen
+        if self.cumulative_volume and tick.timestamp == self.tick_timestamp:
+            available_volume = max(available_volume - self.taken_volume.get(handle.code, 0.0), 0.0)
+
+        if size is None:
+            if side == self.SELL:
+                size_to_liq = min(held, available_volume)
+                if self.execution_model is not None:
+                    exec_price = self.execution_model.get_price(side, size_to_liq, product_info)
+                return self.TRADE_OK, size_to_liq, size_to_liq, exec_price, None
+            # volume is capped in the base currency, step down if converting back rounds over the cap
+            if self.execution_model is not None:
+                exec_price = self.execution_model.get_price(side, available_volume, product_info)
+                size_to_liq = min(held, available_volume * exec_price)
+                exec_price = self.execution_model.get_price(side, size_to_liq / product_info.close, product_info)
+            else:
+                size_to_liq = min(held, available_volume * exec_price)
+            if size_to_liq / exec_price > available_volume:
+                size_to_liq = float(np.nextafter(size_to_liq, 0))
+            return self.TRADE_OK, size_to_liq, size_to_liq / exec_price, exec_price, None
+
+        # negative size liquidates the entire position
+        size_to_liq = held if size < 0 else size
+
+        if size_to_liq > held:
+            # ensure holding enough funds to execute
+            return self.INSUFFICIENT_FUNDS, size_to_liq, 0.0, exec_price, f'INSUFFICIENT FUNDS : attempted to liquidate {size_to_liq} {liq_instr} only holding {held} {liq_instr}'
+
+        if self.execution_model is not None:
+            # participation of a buy is measured at the close, it then moves size_to_liq / exec_price
+            exec_price = self.execution_model.get_price(side, size_to_liq / exec_price if side == self.BUY else size_to_liq, product_info)
+
+        volume_moving = size_to_liq / exec_price if side == self.BUY else size_to_liq
+
+        if available_volume < volume_moving:
+            # ensure enough market volume to execute trade
+            return self.INSUFFICIENT_VOLUME, size_to_liq, volume_moving, exec_price, f'INSUFFICIENT MARKET VOLUME : attempting to move {volume_moving} {handle.base} only {available_volume} {handle.base} available'
+
+        return self.TRADE_OK, size_to_liq, volume_moving, exec_price, None
+
+    ################################################################################
+    def apply_trade(self, tick, handle, side, size_to_liq, volume_moving, exec_price, holdings, group=-1):
+        """
+
+        Apply a trade that passed check_trade to a holdings dict and record it. Should only be used internally as a helper function.
+
+        Parameters: 
+        tick           (TDSTick)           : current tick 
+        handle         (TDSProductHandle)  : handle from register_product 
+        side           (int)               : BUY or SELL
+        size_to_liq    (float)             : amount of held currency to liquidate, from check_trade
+        volume_moving  (float)             : volume moved in the base currency, from check_trade
+        exec_price     (float)             : execution price, from check_trade
+        holdings       (dict)              : holdings to trade from
+        group          (int)               : group id of a multi-leg trade, -1 for a single trade
+    
+        Returns: 
+        int: index of the trade in the trade log 
+    
+        """ 
+
+        if side == self.SELL:
+            liq_instr = handle.base
+            aq_instr = handle.quote
+        else:
+            liq_instr = handle.quote
+            aq_instr = handle.base
+
+        holdings[liq_instr] = holdings[liq_instr] - size_to_liq
+
+        fee = self.fee_rate * size_to_liq
+        size_to_liq -= fee
+        conv_volume = size_to_liq / exec_price if side == self.BUY else size_to_liq * exec_price
+
+        holdings[aq_instr] = holdings.get(aq_instr, 0) + conv_volume
+
+        if self.cumulative_volume:
+            self.taken_volume[handle.code] = self.taken_volume.get(handle.code, 0.0) + volume_moving
+
+        if self.fee_tiers is None:
+            return self.trade_log.append_coded(tick.date, tick.timestamp, handle.code, side, volume_moving, exec_price, holdings, group, fee, np.nan, 0)
+
+        # the trade pays the tier it was made in and counts towards the next one
+        notional = self.get_usd_notional(tick, handle.quote, volume_moving * exec_price)
+        i = self.trade_log.append_coded(tick.date, tick.timestamp, handle.code, side, volume_moving, exec_price, holdings, group, fee, notional, self.fee_tier)
+        self.notional_volume += notional
+        self.update_fee_tier(tick.timestamp)
+        return i
+
+    ################################################################################
+    def update_fee_tier(self, timestamp):
+        """
+
+        Drop trades older than NOTIONAL_WINDOW from the trailing usd notional and pick the fee tier it falls in --
+        every trade is dropped once, so this is O(1) amortized
+
+        Parameters: 
+        timestamp  (int)  : current timestamp
+    
+        Returns: 
+        None
+    
+        """ 
+        trade_log = self.trade_log
+        num_trades = len(trade_log)
+        cutoff = timestamp - self.NOTIONAL_WINDOW
+        while self.notional_start < num_trades and trade_log.get_value('timestamp', self.notional_start) <= cutoff:
+            notional = trade_log.get_value('notional', self.notional_start)
+            if notional == notional:
+                self.notional_volume -= notional
+            self.notional_start += 1
+
+        # an empty window is exactly 0 rather than the round off of adding and removing every trade
+        if self.notional_start == num_trades:
+            self.notional_volume = 0.0
+
+        self.fee_tier = bisect.bisect_right(self.fee_tier_volumes, self.notional_volume) - 1
+        self.fee_rate = self.fee_tiers[self.fee_tier][1]
+
+    ################################################################################
+    def get_usd_notional(self, tick, currency, amount):
+        """
+
+        Value an amount in usd at tick prices, falling back to the last usd rate seen if the tick can't price it
+
+        Parameters: 
+        tick      (TDSTick)  : current tick 
+        currency  (str)      : currency symbol of the amount
+        amount    (float)    : amount to value
+    
+        Returns: 
+        float : usd value, 0 if the currency has never been priced
+    
+        """ 
+        if currency == 'USD':
+            return amount
+
+        rate = self.get_tick_rate(tick, currency, 'USD')
+        if rate == rate:
+            self.usd_rates[currency] = rate
+        else:
+            rate = self.usd_rates.get(currency)
+            if rate is None:
+                logging.info(f'no usd rate for {currency}, trade not counted towards the fee tier')
+                return 0.0
+
+        return amount * rate
+
+    ################################################################################
+    def get_fees_by_tier(self):
+        """
+
+        Get the trades made and fees paid in each fee tier
+
+        Returns: 
+        DataFrame  : df of min_volume, fee_rate, trades, notional and fees -- notional and fees in usd, which are only
+                     tracked with fee_tiers
+    
+        """ 
+        tiers = self.fee_tiers if self.fee_tiers is not None else [(0, self.fee_rate)]
+        fee_tier = self.trade_log.get_column('fee_tier')
+        notional = self.trade_log.get_column('notional')
+        paid = fee_tier >= 0
+
+        rates = np.array([rate for volume, rate in tiers], dtype=np.float64)
+        notionals = np.bincount(fee_tier[paid], weights=notional[paid], minlength=len(tiers)).astype(np.float64)
+        if self.fee_tiers is None:
+            notionals[:] = np.nan
+
+        return pd.DataFrame({
+            'min_volume' : [volume for volume, rate in tiers],
+            'fee_rate'   : rates,
+            'trades'     : np.bincount(fee_tier[paid], minlength=len(tiers)),
+            'notional'   : notionals,
+            'fees'       : notionals * rates,
+        })
+
+    ################################################################################
+    def execute_trade(self, tick, handle, side, size, holdings, group=-1):
+        """
+
+        Validate a trade, apply it to a holdings dict and record it. Should only be used internally as a helper function.
+
+        Parameters: 
+        tick      (TDSTick)           : current tick 
+        handle    (TDSProductHandle)  : handle from register_product 
+        side      (int)               : BUY or SELL
+        size      (float)             : Amount of HELD currency to trade 
+        holdings  (dict)              : holdings to trade from
+        group     (int)               : group id of a multi-leg trade, -1 for a single trade
+    
+        Returns: 
+        int: index of the trade in the trade log 
+    
+        """ 
+
+        self.start_tick(tick)
+        status, size_to_liq, volume_moving, exec_price, error = self.check_trade(tick, handle, side, size, holdings)
+        if error is not None:
+            raise Exception(error)
+
+        return self.apply_trade(tick, handle, side, size_to_liq, volume_moving, exec_price, holdings, group)
+
+    ################################################################################
+    def try_trade(self, tick, product, side, size):
+        """
+
+        Attempt to make a trade without raising. Same rules as make_trade, an invalid trade is reported by its status
+
+        Parameters: 
+        tick    (TDSTick)  : current tick 
+        product (str)      : '<BASE>-<QUOTE>', or a TDSProductHandle
+        side    (str)      : 'buy' or 'sell', or a side code
+        size    (float)    : Amount of HELD currency to trade 
+    
+        Returns: 
+        tuple : (status, i) -- TRADE_OK and the index of the trade in the trade log, otherwise the failed check and None
+    
+        """ 
+
+        handle = product if isinstance(product, TDSProductHandle) else self.register_product(product)
+        side_code = self.SIDE_CODES.get(side.lower(), -1) if isinstance(side, str) else side
+
+        self.start_tick(tick)
+        status, size_to_liq, volume_moving, exec_price, error = self.check_trade(tick, handle, side_code, size, self.holdings)
+        if error is not None:
+            return status, None
+
+        i = self.apply_trade(tick, handle, side_code, size_to_liq, volume_moving, exec_price, self.holdings)
+        if self.journal is not None:
+            self.update_journal()
+        return status, i
+
+    ################################################################################
+    def get_max_trade_size(self, tick, product, side, holdings=None):
+        """
+
+        Get the largest size make_trade would accept right now, bounded by both the held funds and the market volume.
+        Buys under an execution model whose price rises with size get a size that is accepted but may not be the largest
+
+        Parameters: 
+        tick      (TDSTick)  : current tick 
+        product   (str)      : '<BASE>-<QUOTE>', or a TDSProductHandle
+        side      (str)      : 'buy' or 'sell', or a side code
+        holdings  (dict)     : holdings to trade from, defaults to the current holdings
+    
+        Returns: 
+        float : max amount of HELD currency to trade, 0 if the trade can't be made at all
     
+        """ 
+
+        handle = product if isinstance(product, TDSProductHandle) else self.register_product(product)
+        side_code = self.SIDE_CODES.get(side.lower(), -1) if isinstance(side, str) else side
+
+        status, size_to_liq, volume_moving, exec_price, error = self.check_trade(tick, handle, side_code, None, self.holdings if holdings is None else holdings)
+        return size_to_liq
+
     ################################################################################
-    def __init__(self, start_date, end_date, holdings, max_taken_vol=0.5, fee_rate=0.0018):
+    def make_trades(self, tick, legs):
         """
 
-        Interface to make and track trades
+        Atomically make a multi-leg trade, ex. an arbitrage cycle. Legs run in order, so a leg can use what earlier
+        legs acquired (size -1 liquidates the entire position at that point). If any leg is invalid the tracker is
+        restored to its state before the first leg and an error is raised, otherwise all legs are recorded under one group id.
+        Legs are executed then rolled back rather than all checked up front, since a leg is only valid given the exact
+        fills, fees and taken volume of the legs before it, and each leg is its own trade record as a trade moves one product
 
         Parameters: 
-        start_date     (str)    : YYYYMMDD start date 
-        end_date       (str)    : YYYYMMDD end date
-        holdings       (dict)   : initial holdings dict
-        max_taken_vol  (float)  : Max pct of volume that can be taken in a given tick
-        fee_rate       (float)  : Fee rate per transaction
+        tick    (TDSTick)  : current tick 
+        legs    (list)     : list of (product, side, size) -- product may be a TDSProductHandle and side a side code
+    
+        Returns: 
+        int: group id of the recorded legs 
     
         """ 
-        self.start_date = start_date
-        self.end_date = end_date
-        self.trades = []
-        self.holdings = holdings
-        self.max_taken_vol = max_taken_vol
-        self.fee_rate = fee_rate
-        self.initial_holdings = self.holdings.copy()
+
+        snapshot = self.snapshot()
+        group = self.trade_log.new_group()
+
+        for i, (product, side, size) in enumerate(legs):
+            try:
+                handle = product if isinstance(product, TDSProductHandle) else self.register_product(product)
+                side_code = self.SIDE_CODES.get(side.lower()) if isinstance(side, str) else side
+                if side_code is None:
+                    raise Exception(f'INVALID SIDE : {side.lower()}')
+                self.execute_trade(tick, handle, side_code, size, self.holdings, group)
+            except Exception as e:
+                self.restore(snapshot)
+                raise Exception(f'MULTI-LEG TRADE REJECTED : leg {i} ({getattr(product, "product", product)} {side}) -- {e}')
+
+        if self.journal is not None:
+            self.update_journal()
+        return group
 
     ################################################################################
-    def get_holdings(self):
+    def snapshot(self):
+        """
+
+        Capture the tracker state in O(1) so that hypothetical trades can be undone with restore. Only the small
+        holdings and taken volume dicts are copied, the trade log and equity curve are captured by their lengths
+
+        Returns: 
+        TDSTrackerSnapshot : tracker state
+    
         """ 
+        return TDSTrackerSnapshot(self.holdings.copy(), len(self.trade_log), self.trade_log.num_groups, self.num_equity, self.equity_ticks,
+                                  self.taken_volume.copy(), self.tick_timestamp, self.notional_start, self.notional_volume, self.fee_tier)
 
-        Retrieve the current holding dictionary. 
+    ################################################################################
+    def restore(self, snapshot):
+        """
+
+        Roll the tracker back to a snapshot, dropping every trade made since. A snapshot can be restored any number of times
+
+        Parameters: 
+        snapshot  (TDSTrackerSnapshot)  : state from snapshot
     
         Returns: 
-        dict: current holdings 
+        None
     
         """ 
-        return self.holdings
-        
+        if snapshot.num_trades > len(self.trade_log):
+            raise Exception(f'INVALID SNAPSHOT : snapshot has {snapshot.num_trades} trades, tracker only {len(self.trade_log)}')
+        if self.journal is not None and snapshot.num_trades < self.journaled_trades:
+            raise Exception(f'CANNOT RESTORE : {self.journaled_trades - snapshot.num_trades} trades after the snapshot are already journaled')
+
+        self.trade_log.truncate(snapshot.num_trades)
+        self.trade_log.num_groups = snapshot.num_groups
+
+        # update in place so references to the holdings dict stay valid
+        self.holdings.clear()
+        self.holdings.update(snapshot.holdings)
+        self.taken_volume = snapshot.taken_volume.copy()
+        self.tick_timestamp = snapshot.tick_timestamp
+        self.notional_start = snapshot.notional_start
+        self.notional_volume = snapshot.notional_volume
+        self.fee_tier = snapshot.fee_tier
+        if self.fee_tiers is not None:
+            self.fee_rate = self.fee_tiers[self.fee_tier][1]
+
+        if snapshot.num_equity < self.equity_offset:
+            self.flatten_equity()
+        self.num_equity = snapshot.num_equity
+        self.equity_ticks = snapshot.equity_ticks
+
     ################################################################################
-    def get_trades(self):
+    def fork(self):
         """
 
-        Retrieve the current trade history 
+        Make an independent copy of the tracker in O(1) to evaluate a hypothetical branch. The fork shares the trade
+        log and equity curve so far copy-on-write and shares the market data caches, it never writes to the journal
+
+        Returns: 
+        TDSTransactionTracker : forked tracker
     
+        """ 
+        fork = copy.copy(self)
+        fork.holdings = self.holdings.copy()
+        fork.taken_volume = self.taken_volume.copy()
+        fork.products = dict(self.products)
+        fork.trade_log = self.trade_log.fork()
+        fork.journal = None
+        fork.metrics = TDSPerformanceMetrics(fork)
+
+        fork.equity_timestamps = np.zeros(64, dtype=np.int64)
+        fork.equity_values = np.zeros(64)
+        fork.equity_offset = self.num_equity
+        fork.equity_segments = list(self.equity_segments)
+        if self.num_equity > self.equity_offset:
+            num_points = self.num_equity - self.equity_offset
+            fork.equity_segments.append((self.equity_timestamps[:num_points], self.equity_values[:num_points]))
+        fork.equity_shared = 0
+        self.equity_shared = self.num_equity
+
+        return fork
+
+    ################################################################################
+    def flatten_equity(self):
+        """
+
+        Copy the equity points a fork reads from its ancestors into its own arrays
+
         Returns: 
-        list: list of current trade history 
+        None
     
         """ 
-        return self.trades
+        if self.equity_offset == 0:
+            return
+
+        num_points = self.num_equity - self.equity_offset
+        segments = self.equity_segments + [(self.equity_timestamps[:num_points], self.equity_values[:num_points])]
+        padding = max(num_points, 64)
+        self.equity_timestamps = np.concatenate([timestamps for timestamps, values in segments] + [np.zeros(padding, dtype=np.int64)])
+        self.equity_values = np.concatenate([values for timestamps, values in segments] + [np.zeros(padding)])
+        self.equity_offset = 0
+        self.equity_segments = []
+
+    ################################################################################
+    def get_config(self):
+        """
+
+        Get the settings needed to reconstruct the tracker
+
+        Returns: 
+        dict : tracker settings
     
+        """ 
+        return {
+            'start_date'          : self.start_date,
+            'end_date'            : self.end_date,
+            'initial_holdings'    : self.initial_holdings,
+            'max_taken_vol'       : self.max_taken_vol,
+            'fee_rate'            : self.fee_rate,
+            'conversion_products' : self.conversion_graph.products,
+            'cumulative_volume'   : self.cumulative_volume,
+            'fee_tiers'           : self.fee_tiers,
+            'execution_model'     : self.execution_model.get_config() if self.execution_model is not None else None,
+        }
+
     ################################################################################
-    def get_max_taken_volume(self):
+    def open_journal(self, filepath, flush_every=1000, flush_seconds=5.0, append=False):
         """
 
-        Retrieve the max taken volume (max pct of volume that can be taken in a single tick)
+        Stream trades to an append-only journal as they are made. The trade log buffers trades until flush_every
+        trades or flush_seconds have accumulated, then the batch is written and flushed
+
+        Parameters: 
+        filepath       (str)    : journal path -- a '.parquet' path is written as a directory of parquet batches,
+                                  anything else as JSON Lines
+        flush_every    (int)    : max number of trades to buffer
+        flush_seconds  (float)  : max seconds to buffer trades for
+        append         (bool)   : continue an existing journal that already holds every trade made so far
     
         Returns: 
-        float: max take volume 
+        None
     
         """ 
-        return self.max_taken_vol
-    
+        self.close_journal()
+        self.journal = TDSTradeJournal(filepath, self.get_config(), append)
+        self.journal_flush_every = flush_every
+        self.journal_flush_seconds = flush_seconds
+        self.journaled_trades = len(self.trade_log) if append else 0
+        self.journal_flush_time = time.time()
+
     ################################################################################
-    def make_trade(self, tick, product, side, size):
+    def update_journal(self, force=False):
         """
 
-        Attempt to make a trade. Error if attempted trade is invalid, otherwise return the trade record
+        Write buffered trades to the journal if the buffer is full or old enough
 
         Parameters: 
-        tick    (TDSTick)  : current tick 
-        product (str)      : '<BASE>-<QUOTE>' 
-        side    (str)      : 'buy' or 'sell'
-        size    (float)    : Amount of HELD currency to trade 
+        force  (bool)  : write regardless of the buffer size and age
     
         Returns: 
-        dict: record of the single trade 
+        None
     
         """ 
+        num_trades = len(self.trade_log)
+        if num_trades == self.journaled_trades:
+            return
+        if not force and num_trades - self.journaled_trades < self.journal_flush_every and time.time() - self.journal_flush_time < self.journal_flush_seconds:
+            return
 
-        side = side.lower()
-        liq_instr = None
-        aq_instr = None
+        self.journal.write(self.trade_log.get_trade_dicts(self.journaled_trades, num_trades, include_journal_keys=True))
+        self.journaled_trades = num_trades
+        self.journal_flush_time = time.time()
 
-        base = product.split('-')[0]
-        quote = product.split('-')[1]
+    ################################################################################
+    def close_journal(self):
+        """
 
-        if side.lower() == 'sell':
-            liq_instr = base
-            aq_instr = quote
-        elif side.lower() == 'buy':
-            liq_instr = quote
-            aq_instr = base
-        else:
-            # check if side is invalid
-            raise Exception(f'INVALID SIDE : {side}')
+        Flush any buffered trades and close the journal
 
-        size_to_liq = size
-        if liq_instr not in self.holdings:
-            # ensure holding enough funds to execute
-            raise Exception(f'INSIFFICIENT FUNDS : Not holding any {liq_instr}')
+        Returns: 
+        None
     
-        if size < 0:
-            # liquidate entire position
-            size_to_liq = self.holdings[liq_instr]
-        
-        if size_to_liq > self.holdings[liq_instr]:
-            # ensure holding enough funds to execute
-            raise Exception(f'INSUFFICIENT FUNDS : attempted to liquidate {size_to_liq} {liq_instr} only holding {self.holdings[liq_instr]} {liq_instr}')
-        
+        """ 
+        if self.journal is not None:
+            self.update_journal(force=True)
+            self.journal.close()
+            self.journal = None
 
-        product_info = getattr(tick.p, product.lower().replace('-', '_'))
+    ################################################################################
+    def get_checkpoint(self):
+        """
 
-        available_volume = product_info.volume * self.max_taken_vol
+        Capture the tracker state to resume from after a crash, see resume_checkpoint. The trades themselves stay in
+        the journal, which is flushed first so the checkpoint only records how far into it they go
 
-        volume_moving = size_to_liq
-        if side.lower() == 'buy':
-            volume_moving = size_to_liq / product_info.close
-        
-        if available_volume < volume_moving:
-            # ensure enough market volume to execute trade
-            raise Exception(f'INSUFFICIENT MARKET VOLUME : attempting to move {volume_moving} {base} only {available_volume} {base} available')
+        Returns: 
+        dict : snapshot, journal position, USD rates and equity curve
+    
+        """ 
+        if self.journal is None:
+            raise Exception('NO JOURNAL : a checkpoint needs an open journal to hold the trades')
+
+        self.update_journal(force=True)
+        self.flatten_equity()
+        return {
+            'snapshot'          : self.snapshot(),
+            'journal_position'  : self.journal.get_position(),
+            'usd_rates'         : dict(self.usd_rates),
+            'equity_timestamps' : self.equity_timestamps[:self.num_equity].copy(),
+            'equity_values'     : self.equity_values[:self.num_equity].copy(),
+        }
+
+    ################################################################################
+    def resume_checkpoint(self, checkpoint, filepath, flush_every=1000, flush_seconds=5.0):
+        """
+
+        Restore a checkpoint into a new tracker constructed with the same settings. The trades up to the checkpoint
+        are read back from the journal, any written after it are cut off and the journal is reopened to continue
 
-        self.holdings[liq_instr] -= size_to_liq
+        Parameters: 
+        checkpoint     (dict)   : state from get_checkpoint
+        filepath       (str)    : path of the journal the checkpoint was taken from
+        flush_every    (int)    : see open_journal
+        flush_seconds  (float)  : see open_journal
+    
+        Returns: 
+        None
+    
+        """ 
+        if len(self.trade_log) > 0:
+            raise Exception(f'CANNOT RESUME : tracker already has {len(self.trade_log)} trades')
 
-        size_to_liq -= self.fee_rate * size_to_liq
+        self.close_journal()
+        snapshot = checkpoint['snapshot']
+        TDSTradeJournal.truncate(filepath, checkpoint['journal_position'])
+        header, trades = TDSTradeJournal.read(filepath)
+        if len(trades) != snapshot.num_trades:
+            raise Exception(f'INVALID CHECKPOINT : checkpoint has {snapshot.num_trades} trades, journal {len(trades)}')
 
-        conv_volume = None
-        exec_price = None
+        self.trade_log.extend(trades)
+        self.usd_rates = dict(checkpoint['usd_rates'])
 
-        # execute at the close price
-        if side.lower() == 'buy':
-            exec_price = product_info.close
-            conv_volume = size_to_liq / exec_price
-        elif side.lower() == 'sell':
-            exec_price = product_info.close
-            conv_volume = size_to_liq * exec_price
+        padding = max(snapshot.num_equity, 1024)
+        self.equity_timestamps = np.concatenate([checkpoint['equity_timestamps'], np.zeros(padding, dtype=np.int64)])
+        self.equity_values = np.concatenate([checkpoint['equity_values'], np.zeros(padding)])
+        self.equity_offset = 0
+        self.equity_segments = []
 
-        # adjust holdings
-        if aq_instr not in self.holdings:
-            self.holdings[aq_instr] = 0
-        
+        self.restore(snapshot)
+        self.open_journal(filepath, flush_every, flush_seconds, append=True)
 
-        self.holdings[aq_instr] += conv_volume
+    ################################################################################
+    @classmethod
+    def from_journal(cls, filepath, cb_data_obj=None):
+        """
 
-        # create the trade record
-        trade = {
-            'date'      : tick.date,
-            'timestamp' : tick.timestamp,
-            'side'      : side,
-            'size'      : volume_moving,
-            'price'     : exec_price,
-            'product'   : product,
-            'holdings'  : self.holdings.copy(),
-         }
+        Reconstruct a tracker from a journal
 
-        self.trades.append(trade)
-        return trade
+        Parameters: 
+        filepath     (str)              : journal path
+        cb_data_obj  (TDSCoinbaseData)  : data source for EOD valuation
+    
+        Returns: 
+        TDSTransactionTracker : tracker holding every journaled trade
+    
+        """ 
+        header, trades = TDSTradeJournal.read(filepath)
+        tracker = cls(header['start_date'], header['end_date'], dict(header['initial_holdings']),
+                      max_taken_vol=header['max_taken_vol'], fee_rate=header['fee_rate'], cb_data_obj=cb_data_obj,
+                      conversion_products=header.get('conversion_products'), cumulative_volume=header.get('cumulative_volume', True),
+                      fee_tiers=header.get('fee_tiers'), execution_model=TDSExecutionModel.from_config(header.get('execution_model')))
+        tracker.trade_log.extend(trades)
+        if len(trades) > 0:
+            tracker.holdings = dict(trades[-1]['holdings'])
+            if tracker.fee_tiers is not None:
+                tracker.notional_volume = float(np.nansum(tracker.trade_log.get_column('notional')))
+                tracker.update_fee_tier(trades[-1]['timestamp'])
+        return tracker
 
 
     
@@ -191,7 +1717,7 @@ class TDSTransactionTracker:
     
         """ 
         with open(filepath, 'w') as outfile:
-            json.dump(self.trades, outfile)
+            json.dump(self.get_trades(), outfile)
         
     
     ################################################################################
@@ -209,41 +1735,217 @@ class TDSTransactionTracker:
     
         """ 
 
-        # traverse shortest path to BTC
+        rates = self.get_btc_rates(list(holdings.keys()), [date])[0]
+        return float(np.dot(list(holdings.values()), rates))
+
+    ################################################################################
+    def get_cb_data_obj(self):
+        """
+
+        Get the data source used for valuation, creating the default one on first use
+
+        Returns: 
+        TDSCoinbaseData : data source
+    
+        """ 
+        if self.cb_data_obj is None:
+            self.cb_data_obj = TDSCoinbaseData(cache_path='data')
+        return self.cb_data_obj
+
+    ################################################################################
+    def get_daily_closes(self, product, dates):
+        """
+
+        Get EOD close prices of a product, loading each date only once
+
+        Parameters: 
+        product (str)   : '<BASE>-<QUOTE>'
+        dates   (list)  : YYYYMMDD dates
+    
+        Returns: 
+        ndarray : close price per date
+    
+        """ 
+        closes = self.daily_closes.setdefault(product, {})
+        cb_obj = self.get_cb_data_obj()
+        for date in dates:
+            if date not in closes:
+                df = cb_obj.get_single_day_market_data(product, date, 86400)
+                closes[date] = df['close'].values[0]
+
+        return np.array([closes[date] for date in dates], dtype=np.float64)
+
+    ################################################################################
+    def get_btc_rates(self, currencies, dates):
+        """
+
+        Get the EOD btc value of one unit of each currency on each date
+
+        Parameters: 
+        currencies (list)  : currency symbols
+        dates      (list)  : YYYYMMDD dates
+    
+        Returns: 
+        ndarray : (dates, currencies) array of btc rates
+    
+        """ 
+
+        # traverse the cached conversion path to BTC
         # EX. ETH->USD->BTC
+        rates = self.conversion_graph.get_rates(currencies, lambda product: self.get_daily_closes(product, dates))
+        return np.array(np.broadcast_to(rates, (len(dates), len(currencies))))
 
-        necessary_products = []
-        holdings_copy = holdings.copy()
-        for key in holdings_copy.keys():
-            if key in ['USD', 'GBP', 'EUR']:
-                necessary_products.append(f"BTC-{key}")
-            else:
-                necessary_products.append(f"{key}-USD")
-        
-        necessary_products = list(set(necessary_products))
-        cb_obj = TDSCoinbaseData(cache_path='data')
-        tick_gen = TDSTickGenerator(cb_obj, necessary_products, date, date, interval=86400)
-        tick = tick_gen.get_tick()
+    ################################################################################
+    def get_dates(self):
+        """
 
-        total_btc = 0.0
+        Get every date of the tracked period
 
-        for key in holdings_copy.keys():
-            if key in ['USD', 'GBP', 'EUR']:
-                product_info = getattr(tick.p, f'BTC_{key}'.lower())
-                btc_holdings = holdings_copy[key] / product_info.close
-            elif key == 'BTC':
-                btc_holdings = holdings_copy[key]
-            else:
-                product_info = getattr(tick.p, f'{key}_USD'.lower())
-                usd_info = getattr(tick.p, f'BTC_USD'.lower())
+        Returns: 
+        list : YYYYMMDD dates from start_date to end_date
+    
+        """ 
+        start_dt = datetime(int(self.start_date[:4]), int(self.start_date[4:6]), int(self.start_date[6:8]))
+        end_dt = datetime(int(self.end_date[:4]), int(self.end_date[4:6]), int(self.end_date[6:8]))
+
+        dates = []
+        while start_dt <= end_dt:
+            dates.append(start_dt.strftime('%Y%m%d'))
+            start_dt += timedelta(days=1)
+
+        return dates
+
+    
+
+    ################################################################################
+    def get_tick_rate_path(self, currency, target='BTC'):
+        """
+
+        Get the products to chain to value a currency in btc, or another target currency, at tick prices
+
+        Parameters: 
+        currency (str)  : currency symbol
+        target   (str)  : currency symbol to value in
+    
+        Returns: 
+        list : list of (tick attribute, inverted) legs -- the rate is the product of each leg's close, or its
+               inverse if inverted
+    
+        """ 
+        if self.tick_rate_paths_version != self.conversion_graph.version:
+            self.tick_rate_paths = {}
+            self.tick_rate_paths_version = self.conversion_graph.version
+
+        path = self.tick_rate_paths.get((currency, target))
+        if path is None:
+            path = [(product.lower().replace('-', '_'), inverted) for product, inverted in self.conversion_graph.get_path(currency, target)]
+            self.tick_rate_paths[(currency, target)] = path
+        return path
+
+    ################################################################################
+    def get_tick_rate(self, tick, currency, target='BTC'):
+        """
+
+        Get the rate of a currency in btc, or another target currency, at tick prices
+
+        Parameters: 
+        tick     (TDSTick)  : tick to price with
+        currency (str)      : currency symbol
+        target   (str)      : currency symbol to value in
+    
+        Returns: 
+        float : rate, NaN if the tick is missing a product on the path
+    
+        """ 
+        rate = 1.0
+        for attr, inverted in self.get_tick_rate_path(currency, target):
+            product_info = getattr(tick.p, attr, None)
+            if product_info is None:
+                return np.nan
+            rate = rate / product_info.close if inverted else rate * product_info.close
+        return rate
+
+    ################################################################################
+    def get_tick_btc_value(self, tick, holdings=None):
+        """
+
+        Value holdings in btc at the close prices of a tick
+
+        Parameters: 
+        tick     (TDSTick)  : tick to price with, must hold every product on the valuation paths
+        holdings (dict)     : holdings dict, defaults to the current holdings
+    
+        Returns: 
+        float : btc value
+    
+        """ 
+        if holdings is None:
+            holdings = self.holdings
 
-                usd_holdings = holdings_copy[key] * product_info.close
-                btc_holdings = usd_holdings / usd_info.close
-            total_btc += btc_holdings
+        total_btc = 0.0
+        for currency, amount in holdings.items():
+            if amount == 0:
+                continue
+            for attr, inverted in self.get_tick_rate_path(currency):
+                close = getattr(tick.p, attr).close
+                amount = amount / close if inverted else amount * close
+            total_btc += amount
 
         return total_btc
 
+    ################################################################################
+    def update_equity(self, tick):
+        """
+
+        Advance the intraday equity curve by a tick, recording the btc value every equity_every ticks. Call once per tick
+
+        Parameters: 
+        tick    (TDSTick)  : current tick 
+    
+        Returns: 
+        None
+    
+        """ 
+        self.equity_ticks += 1
+        if (self.equity_ticks - 1) % self.equity_every != 0:
+            return
+
+        if self.num_equity < self.equity_shared:
+            # forks still read these points, so write to a private copy
+            self.equity_timestamps = self.equity_timestamps.copy()
+            self.equity_values = self.equity_values.copy()
+            self.equity_shared = 0
+
+        i = self.num_equity - self.equity_offset
+        if i == len(self.equity_values):
+            self.equity_timestamps = np.concatenate([self.equity_timestamps, np.zeros(i, dtype=np.int64)])
+            self.equity_values = np.concatenate([self.equity_values, np.zeros(i)])
+
+        self.equity_timestamps[i] = tick.timestamp
+        self.equity_values[i] = self.get_tick_btc_value(tick)
+        self.num_equity += 1
+
+    ################################################################################
+    def get_equity_curve(self):
+        """
+
+        Get the intraday btc equity curve with its drawdown from the running peak
+
+        Returns: 
+        DataFrame  : df of timestamp, datetime, BTC and drawdown
     
+        """ 
+        self.flatten_equity()
+        timestamps = self.equity_timestamps[:self.num_equity]
+        equity = self.equity_values[:self.num_equity]
+        drawdown = equity / np.maximum.accumulate(equity) - 1 if self.num_equity > 0 else equity
+
+        return pd.DataFrame({
+            'timestamp' : timestamps,
+            'datetime'  : pd.to_datetime(timestamps, unit='s', utc=True),
+            'BTC'       : equity,
+            'drawdown'  : drawdown,
+        })
 
     ###############################################################################
     def get_holdings_for_date(self, date):
@@ -258,13 +1960,12 @@ class TDSTransactionTracker:
         float : btc value
     
         """ 
-        holdings = self.initial_holdings
+        # trades are recorded in time order so the last trade on or before date is found by bisection
+        i = np.searchsorted(self.trade_log.get_column('date'), int(date), side='right') - 1
+        if i < 0:
+            return self.initial_holdings
 
-        for trade in self.trades:
-            if trade['date'] <= date:
-                holdings = trade['holdings']
-        
-        return holdings
+        return self.trade_log.get_holdings(i)
 
 
     ################################################################################
@@ -278,24 +1979,26 @@ class TDSTransactionTracker:
     
         """ 
 
-        start_dt = datetime(int(self.start_date[:4]), int(self.start_date[4:6]), int(self.start_date[6:8]))
-        end_dt = datetime(int(self.end_date[:4]), int(self.end_date[4:6]), int(self.end_date[6:8]))
+        dates = self.get_dates()
+        trade_log = self.trade_log
 
-        holdings_dict = {}
+        # every currency ever held, in holdings order
+        codes = list(trade_log.holdings_order)
+        currencies = [trade_log.currencies[code] for code in codes]
+        currencies += [currency for currency in self.initial_holdings if currency not in currencies]
 
-        while start_dt <= end_dt:
-            date_str = start_dt.strftime('%Y%m%d')
-            holdings = self.get_holdings_for_date(date_str)
-            holdings_dict[date_str] = self.get_btc_holdings(holdings, date_str)
-            start_dt += timedelta(days=1)
+        # holdings at EOD are those after the last trade on or before each date
+        i = np.searchsorted(trade_log.get_column('date'), np.array(dates, dtype=np.int64), side='right') - 1
+        holdings_matrix = np.zeros((len(dates), len(currencies)))
+        traded = i >= 0
+        holdings_matrix[traded, :len(codes)] = trade_log.get_holdings_matrix()[i[traded]][:, codes]
+        holdings_matrix[~traded] = [self.initial_holdings.get(currency, 0.0) for currency in currencies]
 
-        dates = []
-        holdings = []
+        # each date's holdings vector dotted with that date's rate vector
+        btc = np.einsum('ij,ij->i', np.nan_to_num(holdings_matrix), self.get_btc_rates(currencies, dates))
+
+        holdings = btc.tolist()
 
-        for key in holdings_dict.keys():
-            dates.append(key)
-            holdings.append(holdings_dict[key])
-        
         df = pd.DataFrame.from_dict({'date' : dates, 'BTC' : holdings}).sort_values('date')
         return df
             
@@ -325,12 +2028,19 @@ class TDSTransactionTracker:
     
         """ 
 
-        initial_holding = self.get_btc_holdings(self.initial_holdings, self.start_date)
-        df = self.get_btc_holdings_over_time()
-        first = df['BTC'].values[0]
+        return self.metrics.get_daily_returns()
+    
+    ################################################################################
+    def get_metrics(self):
+        """
 
-        df['pct_diff'] = df['BTC'].pct_change().fillna((first - initial_holding) / initial_holding)
-        return df
+        Get performance metrics -- computed in one pass and memoized until the trade log changes
+        
+        Returns: 
+        dict  : sharpe ratio, sortino ratio, max drawdown, calmar ratio, turnover, fees paid and trade counts
+    
+        """ 
+        return self.metrics.compute()
     
     ################################################################################
     def get_sharpe_ratio(self):
@@ -342,22 +2052,10 @@ class TDSTransactionTracker:
         float  : sharpe ratio over the period
     
         """ 
-        daily_rate = self.BLOCKFI_LENDING_RATE / 365
-        df = self.get_pct_change_per_day()
-        excess_return_std = df['pct_diff'].std()
-        actual_return = df['pct_diff'].mean()
-
-        print('RISK FREE DAILY RETURN : ')
-        print(daily_rate)
-        print('ACTUAL DAILY RETURN : ')
-        print(actual_return)
-        print('EXCESS STD : ')
-        print(excess_return_std)
-
-        return (actual_return - daily_rate) / excess_return_std
-
-
-
+        metrics = self.get_metrics()
 
+        logging.info(f"RISK FREE DAILY RETURN : {metrics['risk_free_daily_return']}")
+        logging.info(f"ACTUAL DAILY RETURN : {metrics['mean_daily_return']}")
+        logging.info(f"EXCESS STD : {metrics['daily_return_std']}")
 
-    
\ No newline at end of file
+        return metrics['sharpe_ratio']
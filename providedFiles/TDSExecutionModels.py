@@ -0,0 +1,260 @@
+import numpy as np
+
+####################################################################################
+class TDSExecutionModel:
+####################################################################################
+
+    # side codes, as TDSTransactionTracker.BUY and TDSTransactionTracker.SELL
+    BUY = 0
+    SELL = 1
+
+    NAME = 'close'
+
+
+    ################################################################################
+    def __init__(self):
+        """
+
+        Execution model that fills every trade at the close -- the tracker's default, and the base class of the
+        other models. Models price a trade from its side, the base volume it moves and the bar it trades in, with the
+        same formula for one trade and for arrays of trades
+
+        """
+        pass
+
+
+    ################################################################################
+    def get_prices(self, sides, volumes, open_, high, low, close, volume):
+        """
+
+        Get the execution price of a batch of trades
+
+        Parameters:
+        sides    (ndarray)  : BUY or SELL of each trade
+        volumes  (ndarray)  : base volume moved by each trade, measured at the close for buys
+        open_    (ndarray)  : bar open of each trade
+        high     (ndarray)  : bar high of each trade
+        low      (ndarray)  : bar low of each trade
+        close    (ndarray)  : bar close of each trade
+        volume   (ndarray)  : bar volume of each trade
+
+        Returns:
+        ndarray : execution price of each trade
+
+        """
+        return np.asarray(close, dtype=np.float64)
+
+
+    ################################################################################
+    def get_price(self, side, volume, product_info):
+        """
+
+        Get the execution price of a single trade
+
+        Parameters:
+        side          (int)              : BUY or SELL
+        volume        (float)            : base volume moved, measured at the close for buys
+        product_info  (SimpleNamespace)  : tick data of the product traded
+
+        Returns:
+        float : execution price
+
+        """
+        return float(self.get_prices(side, volume, product_info.open, product_info.high, product_info.low, product_info.close, product_info.volume))
+
+
+    ################################################################################
+    def get_costs(self, sides, volumes, open_, high, low, close, volume):
+        """
+
+        Get the cost of execution against filling at the close for a batch of trades
+
+        Parameters:
+        sides    (ndarray)  : BUY or SELL of each trade
+        volumes  (ndarray)  : base volume moved by each trade, measured at the close for buys
+        open_    (ndarray)  : bar open of each trade
+        high     (ndarray)  : bar high of each trade
+        low      (ndarray)  : bar low of each trade
+        close    (ndarray)  : bar close of each trade
+        volume   (ndarray)  : bar volume of each trade
+
+        Returns:
+        ndarray : cost of each trade in the quote currency, negative if it filled better than the close
+
+        """
+        prices = self.get_prices(sides, volumes, open_, high, low, close, volume)
+        sign = np.where(np.asarray(sides) == self.BUY, 1.0, -1.0)
+        return sign * (prices - np.asarray(close, dtype=np.float64)) * np.asarray(volumes, dtype=np.float64)
+
+
+    ################################################################################
+    def get_config(self):
+        """
+
+        Get the settings needed to reconstruct the model
+
+        Returns:
+        dict : model name and settings
+
+        """
+        return {'model' : self.NAME}
+
+
+    ################################################################################
+    @staticmethod
+    def from_config(config):
+        """
+
+        Reconstruct a model from get_config
+
+        Parameters:
+        config  (dict)  : output of get_config, None for the default close model
+
+        Returns:
+        TDSExecutionModel : execution model, None for None
+
+        """
+        if config is None:
+            return None
+
+        config = dict(config)
+        models = {model.NAME : model for model in [TDSExecutionModel, TDSVWAPExecution, TDSWorstOfRangeExecution, TDSImpactExecution]}
+        model = models.get(config.pop('model'))
+        if model is None:
+            raise Exception(f'INVALID EXECUTION MODEL : {config}')
+        if 'base_model' in config:
+            config['base_model'] = TDSExecutionModel.from_config(config['base_model'])
+        return model(**config)
+
+
+####################################################################################
+class TDSVWAPExecution(TDSExecutionModel):
+####################################################################################
+
+    NAME = 'vwap'
+
+
+    ################################################################################
+    def __init__(self, include_open=False):
+        """
+
+        Execution model that fills at a VWAP proxy of the bar -- the typical price (high + low + close) / 3, or the
+        OHLC average
+
+        Parameters:
+        include_open  (bool)  : average open, high, low and close instead of the typical price
+
+        """
+        self.include_open = include_open
+
+
+    ################################################################################
+    def get_prices(self, sides, volumes, open_, high, low, close, volume):
+        """
+
+        Get the execution price of a batch of trades, see TDSExecutionModel.get_prices
+
+        """
+        if self.include_open:
+            return (np.asarray(open_, dtype=np.float64) + high + low + close) / 4
+        return (np.asarray(high, dtype=np.float64) + low + close) / 3
+
+
+    ################################################################################
+    def get_config(self):
+        """
+
+        Get the settings needed to reconstruct the model
+
+        Returns:
+        dict : model name and settings
+
+        """
+        return {'model' : self.NAME, 'include_open' : self.include_open}
+
+
+####################################################################################
+class TDSWorstOfRangeExecution(TDSExecutionModel):
+####################################################################################
+
+    NAME = 'worst_of_range'
+
+
+    ################################################################################
+    def __init__(self):
+        """
+
+        Execution model that buys at the bar high and sells at the bar low -- a pessimistic bound on fills
+
+        """
+        pass
+
+
+    ################################################################################
+    def get_prices(self, sides, volumes, open_, high, low, close, volume):
+        """
+
+        Get the execution price of a batch of trades, see TDSExecutionModel.get_prices
+
+        """
+        return np.where(np.asarray(sides) == self.BUY, high, low).astype(np.float64)
+
+
+####################################################################################
+class TDSImpactExecution(TDSExecutionModel):
+####################################################################################
+
+    NAME = 'impact'
+
+
+    ################################################################################
+    def __init__(self, coefficient=0.1, exponent=0.5, base_model=None, clip_to_range=True):
+        """
+
+        Participation based market impact -- a trade taking a fraction p of the bar volume moves the price against
+        itself by coefficient * p ** exponent, the square root law for the default exponent
+
+        Parameters:
+        coefficient    (float)              : impact at 100% participation, as a fraction of the price
+        exponent       (float)              : curvature of the impact in participation
+        base_model     (TDSExecutionModel)  : model of the price before impact, the close if None
+        clip_to_range  (bool)               : keep prices within the bar's high and low
+
+        """
+        self.coefficient = coefficient
+        self.exponent = exponent
+        self.base_model = base_model if base_model is not None else TDSExecutionModel()
+        self.clip_to_range = clip_to_range
+
+
+    ################################################################################
+    def get_prices(self, sides, volumes, open_, high, low, close, volume):
+        """
+
+        Get the execution price of a batch of trades, see TDSExecutionModel.get_prices
+
+        """
+        prices = self.base_model.get_prices(sides, volumes, open_, high, low, close, volume)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            participation = np.minimum(np.asarray(volumes, dtype=np.float64) / volume, 1.0)
+        # no volume means no fill, leave the price alone and let the volume check reject the trade
+        impact = self.coefficient * np.nan_to_num(participation) ** self.exponent
+        prices = np.where(np.asarray(sides) == self.BUY, prices * (1 + impact), prices * (1 - impact))
+
+        if self.clip_to_range:
+            prices = np.clip(prices, low, high)
+        return prices
+
+
+    ################################################################################
+    def get_config(self):
+        """
+
+        Get the settings needed to reconstruct the model
+
+        Returns:
+        dict : model name and settings
+
+        """
+        return {'model' : self.NAME, 'coefficient' : self.coefficient, 'exponent' : self.exponent,
+                'base_model' : self.base_model.get_config(), 'clip_to_range' : self.clip_to_range}
@@ -0,0 +1,197 @@
+import time
+import logging
+import itertools
+import traceback
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from TDSCoinbaseData import TDSCoinbaseData
+from TDSSharedMarketData import TDSSharedMarketData
+from TDSBacktest import TDSBacktest
+
+####################################################################################
+class TDSParameterSweep:
+####################################################################################
+
+    # market data attached once per worker process by init_worker
+    worker_data = None
+    worker_cb_data = None
+
+
+    ################################################################################
+    def __init__(self, strategy_factory, cb_data_obj, products, start_date, end_date, holdings=None, interval=60,
+                 backtest_kwargs=None, processes=None):
+        """
+
+        Run a strategy over many parameter sets in a process pool. The period's market data is loaded once into shared
+        memory and every worker reads it from there rather than loading its own copy
+
+        Parameters:
+        strategy_factory  (function)         : params -> strategy, called as strategy_factory(**params) in the worker --
+                                               must be picklable, ex. a strategy class defined at module level
+        cb_data_obj       (TDSCoinbaseData)  : data source to load the market data with, its cache also values holdings
+        products          (list)             : products to include in each tick
+        start_date        (str)              : YYYYMMDD start date
+        end_date          (str)              : YYYYMMDD end date
+        holdings          (dict)             : starting holdings, 1.0 BTC if None
+        interval          (int)              : tick size
+        backtest_kwargs   (dict)             : extra TDSBacktest arguments, ex. tick_gen_kwargs or tracker_kwargs
+        processes         (int)              : worker processes, the number of cpus if None
+
+        """
+        self.strategy_factory = strategy_factory
+        self.cb_data_obj = cb_data_obj
+        self.products = products
+        self.start_date = start_date
+        self.end_date = end_date
+        self.holdings = holdings
+        self.interval = interval
+        self.backtest_kwargs = backtest_kwargs if backtest_kwargs is not None else {}
+        self.processes = processes
+        self.results = None
+
+
+    ################################################################################
+    @staticmethod
+    def get_grid(param_grid):
+        """
+
+        Get every combination of a parameter grid
+
+        Parameters:
+        param_grid  (dict)  : param -> list of values
+
+        Returns:
+        list : list of param dicts
+
+        """
+        names = list(param_grid.keys())
+        return [dict(zip(names, values)) for values in itertools.product(*[param_grid[name] for name in names])]
+
+
+    ################################################################################
+    @staticmethod
+    def get_random(param_space, num_runs, seed=0):
+        """
+
+        Sample parameter sets at random
+
+        Parameters:
+        param_space  (dict)  : param -> list of values to choose from, (low, high) tuple to sample uniformly, or a
+                               function of a np.random.RandomState
+        num_runs     (int)   : number of parameter sets
+        seed         (int)   : random seed
+
+        Returns:
+        list : list of param dicts
+
+        """
+        rng = np.random.RandomState(seed)
+
+        def sample(space):
+            if callable(space):
+                return space(rng)
+            if isinstance(space, tuple):
+                return float(rng.uniform(space[0], space[1]))
+            return space[rng.randint(len(space))]
+
+        return [{name : sample(space) for name, space in param_space.items()} for i in range(num_runs)]
+
+
+    ################################################################################
+    @classmethod
+    def init_worker(cls, handle, cache_path):
+        """
+
+        Attach a worker process to the shared market data. Should only be used internally as a helper function.
+
+        Parameters:
+        handle      (dict)  : shared market data handle
+        cache_path  (str)   : market data cache, for valuing holdings
+
+        Returns:
+        None
+
+        """
+        logging.getLogger().setLevel(logging.ERROR)
+        cls.worker_data = TDSSharedMarketData(handle)
+        cls.worker_cb_data = TDSCoinbaseData(cache_path)
+
+
+    ################################################################################
+    @classmethod
+    def run_params(cls, run, strategy_factory, params, products, start_date, end_date, holdings, interval, backtest_kwargs):
+        """
+
+        Backtest one parameter set in a worker process. Should only be used internally as a helper function.
+
+        Parameters:
+        run               (int)       : index of the parameter set
+        strategy_factory  (function)  : params -> strategy
+        params            (dict)      : strategy parameters
+        products          (list)      : products to include in each tick
+        start_date        (str)       : YYYYMMDD start date
+        end_date          (str)       : YYYYMMDD end date
+        holdings          (dict)      : starting holdings
+        interval          (int)       : tick size
+        backtest_kwargs   (dict)      : extra TDSBacktest arguments
+
+        Returns:
+        dict : run, params, backtest summary and error, None if the run succeeded
+
+        """
+        start = time.perf_counter()
+        row = {'run' : run, 'params' : params, 'error' : None}
+        try:
+            backtest_kwargs = dict(backtest_kwargs)
+            tracker_kwargs = dict(backtest_kwargs.pop('tracker_kwargs', None) or {})
+            tracker_kwargs.setdefault('cb_data_obj', cls.worker_cb_data)
+            backtest = TDSBacktest(strategy_factory(**params), cls.worker_data, products, start_date, end_date, holdings=holdings,
+                                   interval=interval, tracker_kwargs=tracker_kwargs, **backtest_kwargs)
+            backtest.run()
+            row.update(backtest.get_summary())
+        except Exception as e:
+            row['error'] = f'{e}\n{traceback.format_exc()}'
+        row['run_time'] = time.perf_counter() - start
+        return row
+
+
+    ################################################################################
+    def run(self, param_sets):
+        """
+
+        Backtest every parameter set across the process pool
+
+        Parameters:
+        param_sets  (list)  : list of param dicts, ex. from get_grid or get_random
+
+        Returns:
+        DataFrame : one row per parameter set -- run, one column per param, run_time, every column of
+                    TDSBacktest.get_summary and error, the exception of a failed run
+
+        """
+        start = time.perf_counter()
+        shared = TDSSharedMarketData.create(self.cb_data_obj, self.products, self.start_date, self.end_date, self.interval,
+                                            self.backtest_kwargs.get('tick_gen_kwargs', {}).get('join', 'first'))
+        load_time = time.perf_counter() - start
+
+        try:
+            with ProcessPoolExecutor(self.processes, initializer=TDSParameterSweep.init_worker,
+                                     initargs=(shared.get_handle(), self.cb_data_obj.cache_path)) as pool:
+                futures = [pool.submit(TDSParameterSweep.run_params, run, self.strategy_factory, params, self.products, self.start_date,
+                                       self.end_date, self.holdings, self.interval, self.backtest_kwargs)
+                           for run, params in enumerate(param_sets)]
+                rows = [future.result() for future in futures]
+        finally:
+            shared.close()
+            shared.unlink()
+
+        # params first so the table reads as inputs then outputs
+        df = pd.DataFrame(rows)
+        params = pd.DataFrame([row['params'] for row in rows], index=df.index)
+        df = pd.concat([df[['run']], params, df.drop(columns=['run', 'params', 'error']), df[['error']]], axis=1)
+
+        self.results = df
+        wall_time = time.perf_counter() - start
+        logging.info(f'sweep of {len(param_sets)} runs in {wall_time:.2f}s, {load_time:.2f}s loading market data, {df["error"].notna().sum()} failed')
+        return df
@@ -0,0 +1,100 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'providedFiles'))
+
+from TDSExecutionModels import TDSExecutionModel
+from TDSTickGenerator import TDSTick
+from TDSTransactionTracker import TDSTradeLog, TDSTransactionTracker
+
+
+################################################################################
+def make_trade(product, holdings, timestamp=0):
+    return {'date' : '20200701', 'timestamp' : timestamp, 'product' : product, 'side' : 'buy', 'size' : 1.0,
+            'price' : 100.0, 'holdings' : holdings}
+
+
+################################################################################
+def make_tick(timestamp, close=100.0, volume=10.0):
+    row = np.array([[close, close, close, close, volume]])
+    return TDSTick('20200701', timestamp, None, 60, ['btc_usd'], row)
+
+
+################################################################################
+def test_extend_same_number_of_different_currencies():
+    trade_log = TDSTradeLog()
+    trade_log.extend([make_trade('BTC-USD', {'USD' : 100.0, 'BTC' : 1.0})])
+    trade_log.extend([make_trade('ETH-EUR', {'EUR' : 50.0, 'ETH' : 2.0}, timestamp=1)])
+
+    assert len(trade_log) == 2
+    assert trade_log.get_holdings(0) == {'USD' : 100.0, 'BTC' : 1.0}
+    assert trade_log.get_holdings(1) == {'EUR' : 50.0, 'ETH' : 2.0}
+
+
+################################################################################
+def test_extend_mixed_currencies_in_one_call():
+    trade_log = TDSTradeLog()
+    trade_log.extend([make_trade('BTC-USD', {'USD' : 100.0, 'BTC' : 1.0}),
+                      make_trade('ETH-EUR', {'EUR' : 50.0, 'ETH' : 2.0}, timestamp=1),
+                      make_trade('BTC-USD', {'BTC' : 3.0, 'USD' : 10.0}, timestamp=2)])
+
+    assert [trade_log.get_holdings(i) for i in range(3)] == [{'USD' : 100.0, 'BTC' : 1.0},
+                                                             {'EUR' : 50.0, 'ETH' : 2.0},
+                                                             {'BTC' : 3.0, 'USD' : 10.0}]
+
+
+################################################################################
+def test_get_max_trade_size_leaves_state_unchanged():
+    tracker = TDSTransactionTracker('20200701', '20200701', {'USD' : 10000.0}, fee_tiers=[(0, 0.002), (100, 0.001)])
+    tracker.make_trade(make_tick(0), 'BTC-USD', 'buy', 200.0)
+    state = (tracker.tick_timestamp, dict(tracker.taken_volume), tracker.fee_tier, tracker.notional_start)
+
+    # a new tick has its whole volume available, without the tracker moving on to it
+    assert tracker.get_max_trade_size(make_tick(0), 'BTC-USD', 'buy') == 300.0
+    assert tracker.get_max_trade_size(make_tick(60), 'BTC-USD', 'buy') == 500.0
+    assert (tracker.tick_timestamp, tracker.taken_volume, tracker.fee_tier, tracker.notional_start) == state
+
+
+################################################################################
+def test_make_trade_with_handle_and_side_code():
+    tracker = TDSTransactionTracker('20200701', '20200701', {'USD' : 1000.0})
+    handle = tracker.register_product('BTC-USD')
+    trade = tracker.make_trade(make_tick(0), handle, tracker.BUY, 100.0)
+
+    assert (trade['product'], trade['side']) == ('BTC-USD', 'buy')
+    assert trade == tracker.get_trades()[0]
+
+    with pytest.raises(Exception, match='INVALID SIDE'):
+        tracker.make_trade(make_tick(0), handle, 2, 100.0)
+
+
+################################################################################
+def make_trades_and_errors(tracker):
+    handle = tracker.register_product('BTC-USD')
+    errors = []
+    for i, (side, size) in enumerate([(tracker.BUY, 300.0), (tracker.BUY, 300.0), (tracker.SELL, 1.0), (tracker.SELL, -1), (2, 1.0)]):
+        try:
+            tracker.make_trade_fast(make_tick(60 * (i // 2)), handle, side, size)
+        except Exception as e:
+            errors.append(str(e))
+    try:
+        tracker.make_trades(make_tick(180), [('BTC-USD', 'buy', 100.0), ('BTC-USD', 'sell', 100.0)])
+    except Exception as e:
+        errors.append(str(e))
+    return errors
+
+
+################################################################################
+def test_make_trade_fast_lean_path_matches_execute_trade():
+    lean = TDSTransactionTracker('20200701', '20200701', {'USD' : 1000.0})
+    # a close fill execution model sends every trade through execute_trade instead of the lean path
+    full = TDSTransactionTracker('20200701', '20200701', {'USD' : 1000.0}, execution_model=TDSExecutionModel())
+
+    errors = make_trades_and_errors(lean)
+    assert [error.split(' :')[0] for error in errors] == ['INSUFFICIENT MARKET VOLUME', 'INVALID SIDE', 'MULTI-LEG TRADE REJECTED']
+    assert errors == make_trades_and_errors(full)
+    assert lean.get_trades() == full.get_trades()
+    assert lean.get_holdings() == full.get_holdings()
@@ -0,0 +1,49 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'providedFiles'))
+
+from TDSBenchmark import TDSBenchmark
+from TDSExecutionModels import TDSImpactExecution
+from TDSTickGenerator import TDSTick
+from TDSTransactionTracker import TDSTransactionTracker
+from TDSVectorizedBacktest import TDSVectorizedBacktest
+
+PRODUCTS = ['BTC-USD', 'ETH-USD', 'LTC-USD']
+# a power of two, so the spend of a buy is recovered exactly from its fee
+FEE_RATE = 2 ** -9
+
+
+################################################################################
+def test_vectorized_fills_pass_try_trade(tmp_path):
+    benchmark = TDSBenchmark(cache_path=str(tmp_path))
+    benchmark.make_cache(PRODUCTS, '20200701', 1)
+
+    # a price rising with the size, unclipped by the narrow synthetic bars, and volume caps binding on most buys
+    model = TDSImpactExecution(coefficient=0.1, clip_to_range=False)
+    backtest = TDSVectorizedBacktest(benchmark.cb_data_obj, PRODUCTS, '20200701', '20200701', holdings={'USD' : 1e6},
+                                     max_taken_vol=0.05, fee_rate=FEE_RATE, execution_model=model)
+    weights = np.full((len(backtest.timestamps), len(PRODUCTS)), np.nan)
+    rows = np.arange(0, len(weights), 10)
+    weights[rows] = np.random.RandomState(0).dirichlet(np.ones(len(PRODUCTS) + 1), len(rows))[:, :len(PRODUCTS)]
+    backtest.run(weights)
+
+    # replay each trade on its own, from the holdings the vectorized backtest had before it
+    trade_log = backtest.tracker.trade_log
+    assert len(trade_log) > 0
+    names = [product.lower().replace('-', '_') for product in PRODUCTS]
+    rows = {timestamp : row for row, timestamp in enumerate(backtest.timestamps)}
+    holdings = dict(backtest.initial_holdings)
+    tracker = TDSTransactionTracker('20200701', '20200701', holdings, max_taken_vol=0.05, fee_rate=FEE_RATE, execution_model=model)
+    for i, trade in enumerate(backtest.tracker.get_trades()):
+        timestamp = trade['timestamp']
+        tick = TDSTick(trade['date'], timestamp, None, 60, names, backtest.values[:, rows[timestamp]])
+        size = trade['size'] if trade['side'] == 'sell' else trade_log.get_value('fee', i) / FEE_RATE
+        tracker.holdings = dict(holdings)
+
+        assert tracker.try_trade(tick, trade['product'], trade['side'], size)[0] == tracker.TRADE_OK
+        holdings = trade['holdings']
+
+    benchmark.close()